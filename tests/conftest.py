@@ -0,0 +1,73 @@
+######################################################################
+# the tests run without Blender, a fake bpy (see fake_bpy.py) is
+# installed before texture_locator is imported
+
+import os
+import sys
+
+from types import SimpleNamespace
+
+import pytest
+
+import fake_bpy
+
+bpy = fake_bpy.install()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import texture_locator  # noqa: E402
+
+texture_locator.register()
+
+
+def pytest_addoption(parser):
+    parser.addoption("--sizes", default="100,1000,10000",
+                     help="numbers of images in the synthetic node trees "
+                          "for the benchmarks (comma separated)")
+    parser.addoption("--depth", type=int, default=4,
+                     help="folder depth of the synthetic node trees")
+
+
+# benchmarks with a count argument are run for each size
+
+def pytest_generate_tests(metafunc):
+    if "count" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("sizes")
+        metafunc.parametrize("count", [int(n) for n in sizes.split(",")])
+
+
+@pytest.fixture
+def tl():
+    return texture_locator
+
+
+# fresh state for each test, returns the MyStuff the panel would use
+
+@pytest.fixture
+def stuff(tl):
+    fake_bpy.reset()
+    tl._model["tree"] = tl.TextureTree()
+    tl._scan_cache.clear()
+    tl.forget_tree_contents()
+    s = tl.MyStuff()
+    bpy.context.window_manager.tl_stuff = s
+    yield s
+    fake_bpy.reset()
+    tl._model["tree"] = tl.TextureTree()
+    tl._scan_cache.clear()
+    tl.forget_tree_contents()
+
+
+# a node tree with count Image Texture nodes using files spread over a
+# folder hierarchy in tmp_path (see fake_bpy.make_material) which has
+# been scanned into the list
+
+@pytest.fixture
+def scanned(tl, stuff, tmp_path, count, request):
+    depth = request.config.getoption("depth")
+    material = fake_bpy.make_material(str(tmp_path), count, depth)
+    node_tree = material.node_tree
+    images = tl.scope_images('TREE', node_tree)
+    tl.do_scan(stuff, images)
+    return SimpleNamespace(s=stuff, node_tree=node_tree, images=images,
+                           root=str(tmp_path))
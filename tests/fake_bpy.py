@@ -0,0 +1,436 @@
+######################################################################
+# a fake bpy module - just enough of Blender's API for texture_locator
+# to be imported and its scanning/list/file code to be run without
+# Blender (see conftest.py)
+#
+# PropertyGroups get their properties from their annotations like the
+# real thing (with defaults and update callbacks), collections behave
+# like CollectionProperty and property writes/collection changes are
+# counted in rna["ops"] so tests can check how much work a refresh does
+
+import os
+import sys
+import tempfile
+
+from types import ModuleType, SimpleNamespace
+
+# number of RNA operations (property writes and collection add, remove,
+# move and clear) since the last reset()
+rna = {"ops": 0}
+
+######################################################################
+# bpy.props - each property function makes a Property which says what
+# the initial value is
+
+
+class Property:
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        self.kwargs = kwargs
+
+    def initial(self):
+        if self.kind == "CollectionProperty":
+            return Collection(self.kwargs["type"])
+        if "default" in self.kwargs:
+            return self.kwargs["default"]
+        if self.kind == "EnumProperty":
+            return self.kwargs["items"][0][0]
+        return {"StringProperty": "",
+                "IntProperty": 0,
+                "FloatProperty": 0.0,
+                "BoolProperty": False}.get(self.kind)
+
+
+def property_function(kind):
+    def make(**kwargs):
+        return Property(kind, **kwargs)
+    make.__name__ = kind
+    return make
+
+
+# class -> {name: Property} including base classes
+_class_properties = {}
+
+
+def properties(cls):
+    found = _class_properties.get(cls)
+    if found is None:
+        found = {}
+        for c in reversed(cls.__mro__):
+            for name, prop in vars(c).get("__annotations__", {}).items():
+                if isinstance(prop, Property):
+                    found[name] = prop
+        _class_properties[cls] = found
+    return found
+
+######################################################################
+# bpy.types
+
+
+class PropertyGroup:
+
+    def __init__(self):
+        for name, prop in properties(type(self)).items():
+            object.__setattr__(self, name, prop.initial())
+
+    # writes go through RNA and call the update callback (even if the
+    # value is the same, like Blender)
+    def __setattr__(self, name, value):
+        rna["ops"] += 1
+        object.__setattr__(self, name, value)
+        prop = properties(type(self)).get(name)
+        if prop is not None and "update" in prop.kwargs:
+            prop.kwargs["update"](self, context)
+
+
+class AddonPreferences(PropertyGroup):
+    pass
+
+
+class UIList(PropertyGroup):
+
+    bitflag_filter_item = 1 << 30
+    filter_name = ""
+    use_filter_invert = False
+
+
+class Operator(PropertyGroup):
+
+    @property
+    def properties(self):
+        return self
+
+    def report(self, level, message):
+        object.__setattr__(self, "last_report", (level, message))
+
+
+class Panel:
+    pass
+
+
+class Menu:
+    pass
+
+
+class WindowManager:
+    pass
+
+
+class Image:
+
+    def __init__(self, name, filepath="", source='FILE'):
+        self.name = name
+        self.filepath = filepath
+        self.source = source
+        self.packed_file = None
+        self.reloads = 0
+
+    def as_pointer(self):
+        return id(self)
+
+    @property
+    def original(self):
+        return self
+
+    def reload(self):
+        self.reloads += 1
+
+
+class Node:
+
+    def __init__(self, bl_idname):
+        self.bl_idname = bl_idname
+        self.select = False
+        if bl_idname == "ShaderNodeTexImage":
+            self.image = None
+        elif bl_idname == "ShaderNodeGroup":
+            self.node_tree = None
+
+
+class Nodes(list):
+
+    def new(self, bl_idname):
+        node = Node(bl_idname)
+        self.append(node)
+        return node
+
+
+class NodeTree:
+
+    def __init__(self, name="NodeTree"):
+        self.name = name
+        self.nodes = Nodes()
+
+    def as_pointer(self):
+        return id(self)
+
+    @property
+    def original(self):
+        return self
+
+
+class Material:
+
+    def __init__(self, name):
+        self.name = name
+        self.use_nodes = False
+        self.node_tree = NodeTree(name)
+
+    def as_pointer(self):
+        return id(self)
+
+    @property
+    def original(self):
+        return self
+
+######################################################################
+# collections
+
+
+class Collection:
+
+    """ CollectionProperty """
+
+    def __init__(self, item_type):
+        self.item_type = item_type
+        self.items = []
+
+    def add(self):
+        rna["ops"] += 1
+        item = self.item_type()
+        self.items.append(item)
+        return item
+
+    def remove(self, index):
+        rna["ops"] += 1
+        del self.items[index]
+
+    def move(self, old, new):
+        rna["ops"] += 1
+        self.items.insert(new, self.items.pop(old))
+
+    def clear(self):
+        rna["ops"] += 1
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class IDCollection(list):
+
+    """ bpy.data.images etc """
+
+    def __init__(self, new):
+        super().__init__()
+        self._new = new
+
+    def new(self, name, *args):
+        data = self._new(name)
+        self.append(data)
+        return data
+
+    def remove(self, data):
+        super().remove(data)
+
+    def get(self, name, default=None):
+        for data in self:
+            if data.name == name:
+                return data
+        return default
+
+######################################################################
+# bpy.app.timers - registered functions are only run by run_timers()
+
+
+class Timers:
+
+    def __init__(self):
+        self.registered = []
+
+    def register(self, function, first_interval=0.0, persistent=False):
+        if function not in self.registered:
+            self.registered.append(function)
+
+    def unregister(self, function):
+        self.registered.remove(function)
+
+    def is_registered(self, function):
+        return function in self.registered
+
+######################################################################
+# bpy.path
+
+
+def abspath(path):
+    if path.startswith("//"):
+        return os.path.join(os.path.dirname(data.filepath), path[2:])
+    return path
+
+
+def relpath(path):
+    if not data.filepath:
+        raise ValueError("no blend file")
+    return "//" + os.path.relpath(path, os.path.dirname(data.filepath))
+
+######################################################################
+# bpy.utils.previews
+
+
+class Preview:
+
+    icon_id = 0
+    image_size = (0, 0)
+    icon_size = (0, 0)
+
+
+class Previews(dict):
+
+    def load(self, key, path, kind):
+        self[key] = preview = Preview()
+        return preview
+
+
+def user_resource(kind, path="", create=False):
+    folder = os.path.join(_config_dir, path)
+    if create:
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+######################################################################
+# stands in for a UILayout so rows can be drawn without a UI
+
+
+class Layout:
+
+    def row(self, **kwargs):
+        return self
+
+    def prop(self, *args, **kwargs):
+        pass
+
+    def label(self, **kwargs):
+        pass
+
+######################################################################
+# make a material with count Image Texture nodes using files spread
+# over a folder hierarchy depth folders deep (fan subfolders in each),
+# empty files are made under both src and dst in root
+
+# returns the material
+
+
+def make_material(root, count, depth, fan=4):
+    material = data.materials.new("TextureLocatorBenchmark")
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    for i in range(count):
+
+        # files go at every level so all the folders are in the tree
+        level = i % (depth + 1)
+        parts = [f"f{(i // fan ** d) % fan}" for d in range(level)]
+        relative = os.path.join(*parts, f"tex{i}.png")
+        for side in ("src", "dst"):
+            path = os.path.join(root, side, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+
+        img = data.images.new(f"tex{i}", 4, 4)
+        img.filepath = os.path.join(root, "src", relative)
+        nodes.new("ShaderNodeTexImage").image = img
+    return material
+
+######################################################################
+# the module itself
+
+
+data = SimpleNamespace()
+context = SimpleNamespace()
+app = SimpleNamespace()
+_config_dir = tempfile.mkdtemp(prefix="texture_locator_config")
+
+
+# forget all the data, timers and RNA operations
+def reset():
+    data.filepath = ""
+    data.images = IDCollection(lambda name: Image(name))
+    data.materials = IDCollection(Material)
+    data.node_groups = IDCollection(NodeTree)
+    app.timers.registered.clear()
+    rna["ops"] = 0
+
+
+def install():
+    if "bpy" in sys.modules:
+        return sys.modules["bpy"]
+
+    bpy = ModuleType("bpy")
+
+    props = ModuleType("bpy.props")
+    for kind in ("StringProperty", "EnumProperty", "IntProperty",
+                 "FloatProperty", "CollectionProperty", "BoolProperty",
+                 "PointerProperty"):
+        setattr(props, kind, property_function(kind))
+
+    bpy_types = ModuleType("bpy.types")
+    for cls in (PropertyGroup, AddonPreferences, UIList, Operator, Panel,
+                Menu, WindowManager, Image, Node, NodeTree, Material):
+        setattr(bpy_types, cls.__name__, cls)
+
+    utils = ModuleType("bpy.utils")
+    utils.register_class = lambda cls: None
+    utils.unregister_class = lambda cls: None
+    utils.user_resource = user_resource
+    previews = ModuleType("bpy.utils.previews")
+    previews.new = Previews
+    previews.remove = lambda collection: collection.clear()
+    utils.previews = previews
+
+    path = ModuleType("bpy.path")
+    path.abspath = abspath
+    path.relpath = relpath
+
+    app.background = True
+    app.version_string = "fake"
+    app.binary_path = ""
+    app.timers = Timers()
+    app.handlers = SimpleNamespace(
+        persistent=lambda function: function,
+        depsgraph_update_post=[],
+        load_post=[],
+        undo_post=[],
+        redo_post=[])
+
+    context.window_manager = SimpleNamespace(tl_stuff=None, windows=[])
+    context.preferences = SimpleNamespace(addons={})
+
+    ops = SimpleNamespace(
+        ed=SimpleNamespace(undo_push=lambda: None),
+        node=SimpleNamespace(select_all=lambda action='TOGGLE': None,
+                             view_selected=lambda: None))
+
+    bpy.props = props
+    bpy.types = bpy_types
+    bpy.utils = utils
+    bpy.path = path
+    bpy.app = app
+    bpy.data = data
+    bpy.context = context
+    bpy.ops = ops
+    reset()
+
+    sys.modules.update({
+        "bpy": bpy,
+        "bpy.props": props,
+        "bpy.types": bpy_types,
+        "bpy.utils": utils,
+        "bpy.utils.previews": previews,
+        "bpy.path": path})
+    return bpy
@@ -0,0 +1,43 @@
+######################################################################
+# batch mode reports
+
+import json
+import os
+
+import fake_bpy
+
+
+# a file which the remap fixes isn't counted as missing any more
+
+def test_remap_fixes_missing(tl, stuff, tmp_path):
+    bpy = fake_bpy.install()
+    root = str(tmp_path)
+    for folder in ("new", "kept"):
+        os.makedirs(os.path.join(root, folder))
+    for path in (os.path.join("new", "moved.png"),
+                 os.path.join("kept", "here.png")):
+        open(os.path.join(root, path), "wb").close()
+
+    images = {}
+    for name, path in (("moved", os.path.join("old", "moved.png")),
+                       ("lost", os.path.join("old", "lost.png")),
+                       ("here", os.path.join("kept", "here.png"))):
+        images[name] = img = bpy.data.images.new(name)
+        img.filepath = os.path.join(root, path)
+
+    remap_path = os.path.join(root, "remap.json")
+    with open(remap_path, "w", encoding="utf-8") as f:
+        json.dump({os.path.join(root, "old"): os.path.join(root, "new")}, f)
+
+    report = tl.audit_file('IMAGES', tl.load_remap(remap_path))
+
+    assert report["missing_before"] == 2
+    assert report["missing"] == 1
+    assert report["remapped"] == 1
+    entries = {os.path.basename(e["path"]): e for e in report["files"]}
+    assert entries["moved.png"]["remapped"]
+    assert not entries["lost.png"]["remapped"]
+    assert "new_path" not in entries["here.png"]
+    assert images["moved"].filepath == os.path.join(root, "new",
+                                                    "moved.png")
+    assert images["lost"].filepath == os.path.join(root, "old", "lost.png")
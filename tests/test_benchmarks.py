@@ -0,0 +1,136 @@
+######################################################################
+# benchmarks of the slow bits on synthetic node trees (see conftest.py
+# for the sizes), save a baseline with
+#
+#     python -m pytest tests/test_benchmarks.py --sizes 10000
+#         --benchmark-storage=tests/benchmarks --benchmark-save=baseline
+#
+# and check for regressions against it with
+#
+#     python -m pytest tests/test_benchmarks.py --sizes 10000
+#         --benchmark-storage=tests/benchmarks --benchmark-compare
+#         --benchmark-compare-fail=median:100%
+#
+# only the big trees are compared, the small ones take microseconds so
+# timing noise swamps them
+
+import os
+
+from types import SimpleNamespace
+
+import pytest
+
+import fake_bpy
+
+pytest.importorskip("pytest_benchmark")
+
+
+# full scan from an empty list
+
+def test_scan(benchmark, tl, scanned):
+    s = scanned.s
+
+    def scan():
+        s.list_items.clear()
+        tl._model["tree"] = tl.TextureTree()
+        tl.do_scan(s, scanned.images)
+
+    benchmark(scan)
+    assert len(s.list_items) == len(tl._model["tree"])
+
+
+# rescan with nothing changed
+
+def test_rescan(benchmark, tl, scanned):
+    benchmark(tl.do_scan, scanned.s, scanned.images)
+
+
+# rebuild the UIList filter flags then collapse/expand the root
+
+def test_filter_items(benchmark, tl, scanned):
+    s = scanned.s
+    ui_list = tl.TEXTURE_LOCATOR_UL_List()
+
+    def filter_items():
+        tl._model["tree"].flags = None
+        ui_list.filter_items(None, s, "list_items")
+        s.list_items[0].expanded = False
+        ui_list.filter_items(None, s, "list_items")
+        s.list_items[0].expanded = True
+        return ui_list.filter_items(None, s, "list_items")
+
+    flags, order = benchmark(filter_items)
+    assert all(flags)
+
+
+# type a search one key at a time
+
+def test_filter_text(benchmark, tl, scanned):
+    s = scanned.s
+    ui_list = tl.TEXTURE_LOCATOR_UL_List()
+
+    def filter_text():
+        for n in range(1, 6):
+            ui_list.filter_name = "tex12"[:n]
+            flags, order = ui_list.filter_items(None, s, "list_items")
+        return flags
+
+    flags = benchmark(filter_text)
+    tree = tl._model["tree"]
+    assert all("tex12" in tree.nodes[i].label
+               for i, flag in enumerate(flags)
+               if flag and not tree.nodes[i].is_folder)
+
+
+# folder totals and sorting by them after every file's memory has
+# changed
+
+def test_sort_by_size(benchmark, tl, scanned):
+
+    def sort_by_size():
+        tree = tl._model["tree"]
+        for node in tree.files():
+            tree.set_memory(node.index, node.memory + 1)
+        tree.update_memory()
+        return tree.size_order()
+
+    order = benchmark(sort_by_size)
+    assert sorted(order) == list(range(len(tl._model["tree"])))
+
+
+# draw every row
+
+def test_draw_item(benchmark, tl, scanned):
+    s = scanned.s
+    ui_list = tl.TEXTURE_LOCATOR_UL_List()
+    layout = fake_bpy.Layout()
+
+    def draw():
+        for i, item in enumerate(s.list_items):
+            ui_list.draw_item(None, layout, s, item, 0, s, "list_items",
+                              i, 0)
+
+    benchmark(draw)
+
+
+# select everything under the root folder
+
+def test_select(benchmark, tl, scanned):
+    s = scanned.s
+    s.list_index = 0
+    context = SimpleNamespace(
+        window_manager=SimpleNamespace(tl_stuff=s),
+        space_data=SimpleNamespace(node_tree=scanned.node_tree))
+    op = tl.TEXTURE_LOCATOR_OT_Select()
+
+    assert benchmark(op.execute, context) == {'FINISHED'}
+    assert all(n.select for n in scanned.node_tree.nodes)
+
+
+# move everything from src to dst
+
+def test_change_folder(benchmark, tl, scanned):
+    dst = os.path.join(scanned.root, "dst")
+    missing = benchmark(tl.change_folder, tl._model["tree"], 0, dst)
+    assert missing == 0
+    assert all(img.filepath.startswith(dst) for img in scanned.images)
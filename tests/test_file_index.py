@@ -0,0 +1,82 @@
+######################################################################
+# the Locate Missing index and search
+
+import os
+
+import pytest
+
+
+def write(path, data=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+# a symlink back up the tree is only followed once
+
+def test_symlink_cycle(tl, tmp_path, monkeypatch):
+    root = str(tmp_path / "library")
+    write(os.path.join(root, "a", "b", "tex.png"))
+    try:
+        os.symlink(root, os.path.join(root, "a", "b", "loop"))
+    except (OSError, NotImplementedError):
+        pytest.skip("can't make symlinks")
+
+    listed = []
+    index_folder = tl.index_folder
+
+    def counted(folder, old):
+        listed.append(folder)
+        return index_folder(folder, old)
+
+    monkeypatch.setattr(tl, "index_folder", counted)
+    index = tl.update_file_index({}, [root])
+
+    assert len(listed) == 4
+    assert sorted(index) == [root, os.path.join(root, "a"),
+                             os.path.join(root, "a", "b")]
+    names = tl.files_by_name(index)
+    assert names["tex.png"] == [(os.path.join(root, "a", "b", "tex.png"),
+                                 1)]
+
+
+# a second search only lists the folders which changed
+
+def test_reuse_index(tl, tmp_path):
+    root = str(tmp_path / "library")
+    write(os.path.join(root, "a", "tex.png"))
+    write(os.path.join(root, "b", "other.png"))
+    index = tl.update_file_index({}, [root])
+
+    write(os.path.join(root, "b", "new.png"))
+    os.utime(os.path.join(root, "b"), ns=(0, 0))
+    updated = tl.update_file_index(index, [root])
+    assert updated[os.path.join(root, "a")] is index[os.path.join(root,
+                                                                  "a")]
+    assert "new.png" in updated[os.path.join(root, "b")]["files"]
+
+
+# missing files are found by name (and size if it's known) and the
+# index is saved
+
+def test_locate_missing(tl, tmp_path):
+    root = str(tmp_path / "library")
+    write(os.path.join(root, "textures", "wood.png"), b"wood")
+    write(os.path.join(root, "textures", "stone.png"), b"stone")
+    write(os.path.join(root, "other", "stone.png"), b"no")
+    write(str(tmp_path / "here" / "metal.png"))
+    index_path = str(tmp_path / "file_index.json")
+
+    files = [
+        (1, str(tmp_path / "old" / "textures" / "wood.png"), None),
+        (2, str(tmp_path / "old" / "textures" / "stone.png"), 5),
+        (3, str(tmp_path / "old" / "gone.png"), None),
+        (4, str(tmp_path / "here" / "metal.png"), None)]
+    missing, found = tl.locate_missing(files, [root], True, index_path)
+
+    assert missing == 3
+    assert found == [
+        (1, files[0][1], os.path.join(root, "textures", "wood.png")),
+        (2, files[1][1], os.path.join(root, "textures", "stone.png"))]
+    assert tl.load_file_index(index_path) == tl.update_file_index(
+        {}, [root])
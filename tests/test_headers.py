@@ -0,0 +1,156 @@
+######################################################################
+# reading image sizes and formats from file headers
+
+import os
+import struct
+import zlib
+
+import pytest
+
+
+def png(width, height, depth, color):
+    ihdr = struct.pack(">IIBBBBB", width, height, depth, color, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    return (b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + chunk
+            + struct.pack(">I", zlib.crc32(chunk)))
+
+
+def jpeg(sof, width, height, channels):
+    app0 = b"JFIF\0\x01\x01\0\0\x01\0\x01\0\0"
+    dqt = bytes(65)
+    frame = struct.pack(">BHHB", 8, height, width, channels)
+    frame += b"".join(bytes((i + 1, 0x11, 0)) for i in range(channels))
+    return (b"\xff\xd8"
+            + b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0
+            + b"\xff\xff\xdb" + struct.pack(">H", len(dqt) + 2) + dqt
+            + bytes((0xff, sof)) + struct.pack(">H", len(frame) + 2) + frame
+            + b"\xff\xda\0\x02")
+
+
+def tga(image_type, width, height, bits, alpha):
+    return (struct.pack("<BBBHHBHHHHBB", 0, 0, image_type, 0, 0, 0, 0, 0,
+                        width, height, bits, alpha)
+            + bytes(width * height * bits // 8))
+
+
+def exr(width, height, pixel_types):
+    def attribute(name, kind, value):
+        return (name + b"\0" + kind + b"\0" + struct.pack("<i", len(value))
+                + value)
+
+    channels = b"".join(name + b"\0" + struct.pack("<i", kind) + bytes(12)
+                        for name, kind in zip([b"A", b"B", b"G", b"R"],
+                                              pixel_types))
+    return (b"\x76\x2f\x31\x01" + struct.pack("<I", 2)
+            + attribute(b"compression", b"compression", b"\0")
+            + attribute(b"channels", b"chlist", channels + b"\0")
+            + attribute(b"dataWindow", b"box2i",
+                        struct.pack("<iiii", 10, 20, 10 + width - 1,
+                                    20 + height - 1))
+            + b"\0")
+
+
+def tiff(endian, width, height, bits, channels):
+    e = "<" if endian == b"II" else ">"
+    count = 4
+    extra = 8 + 2 + count * 12 + 4
+    entries = [
+        struct.pack(e + "HHIHH", 256, 3, 1, width, 0),
+        struct.pack(e + "HHII", 257, 4, 1, height),
+        struct.pack(e + "HHII", 258, 3, channels, extra),
+        struct.pack(e + "HHIHH", 277, 3, 1, channels, 0)]
+    return (endian + struct.pack(e + "HI", 42, 8)
+            + struct.pack(e + "H", count) + b"".join(entries)
+            + struct.pack(e + "I", 0)
+            + struct.pack(e + "H" * channels, *[bits] * channels))
+
+
+def hdr(width, height):
+    return (b"#?RADIANCE\n# made by a test\nFORMAT=32-bit_rle_rgbe\n\n"
+            + f"-Y {height} +X {width}\n".encode() + bytes(16))
+
+
+SAMPLES = [
+    ("rgba.png", png(640, 480, 8, 6), ("PNG", 640, 480, 4, 8)),
+    ("grey16.png", png(33, 17, 16, 0), ("PNG", 33, 17, 1, 16)),
+    ("palette.png", png(8, 8, 4, 3), ("PNG", 8, 8, 3, 8)),
+    ("baseline.jpg", jpeg(0xc0, 1920, 1080, 3), ("JPEG", 1920, 1080, 3, 8)),
+    ("progressive.jpg", jpeg(0xc2, 1024, 768, 3),
+     ("JPEG", 1024, 768, 3, 8)),
+    ("grey.jpg", jpeg(0xc2, 100, 50, 1), ("JPEG", 100, 50, 1, 8)),
+    ("rgba.tga", tga(2, 4, 3, 32, 8), ("TGA", 4, 3, 4, 8)),
+    ("rgb.TGA", tga(10, 5, 2, 24, 0), ("TGA", 5, 2, 3, 8)),
+    ("grey.tga", tga(3, 2, 2, 8, 0), ("TGA", 2, 2, 1, 8)),
+    ("half.exr", exr(256, 128, [1, 1, 1, 1]), ("EXR", 256, 128, 4, 16)),
+    ("float.exr", exr(64, 32, [2, 1, 1]), ("EXR", 64, 32, 3, 32)),
+    ("intel.tif", tiff(b"II", 300, 200, 16, 3), ("TIFF", 300, 200, 3, 16)),
+    ("motorola.tif", tiff(b"MM", 7, 9, 8, 4), ("TIFF", 7, 9, 4, 8)),
+    ("sky.hdr", hdr(1024, 512), ("HDR", 1024, 512, 3, 32)),
+]
+
+
+@pytest.mark.parametrize("name, data, expected", SAMPLES,
+                         ids=[s[0] for s in SAMPLES])
+def test_read_image_info(tl, tmp_path, name, data, expected):
+    path = tmp_path / name
+    path.write_bytes(data)
+    info = tl.read_image_info(str(path), os.stat(path))
+    assert info == tl.ImageInfo(*expected)
+    format, width, height, channels, depth = expected
+    assert tl.image_memory(info) == (width * height * channels
+                                     * ((depth + 7) // 8))
+
+
+# things which aren't images (or are cut short) have no info
+
+@pytest.mark.parametrize("name, data", [
+    ("notes.txt", b"hello"),
+    ("short.png", png(1, 1, 8, 6)[:20]),
+    ("short.jpg", jpeg(0xc2, 1, 1, 3)[:30]),
+    ("short.exr", exr(1, 1, [1])[:40]),
+    ("short.tga", b"\0\0\2")])
+def test_unreadable(tl, tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    assert tl.read_image_info(str(path), os.stat(path)) is None
+    assert tl.image_memory(None) == 0
+
+
+# the status check only stat's each file once (the header cache uses the
+# same stat)
+
+def test_file_status_stat_once(tl, tmp_path, monkeypatch):
+    path = str(tmp_path / "tex.png")
+    with open(path, "wb") as f:
+        f.write(png(16, 16, 8, 2))
+    stats = []
+    stat = os.stat
+
+    def counted(p, *args, **kwargs):
+        stats.append(p)
+        return stat(p, *args, **kwargs)
+
+    monkeypatch.setattr(tl.os, "stat", counted)
+    for _ in range(2):
+        assert tl.check_file_status(path).info.width == 16
+    assert stats == [path, path]
+
+
+# the status check reads the header (on the worker thread) and it's
+# read again when the file changes
+
+def test_file_status_info(tl, tmp_path):
+    path = tmp_path / "tex.png"
+    path.write_bytes(png(16, 16, 8, 2))
+    status = tl.check_file_status(str(path))
+    assert status.status == 'PRESENT'
+    assert status.info == tl.ImageInfo("PNG", 16, 16, 3, 8)
+
+    path.write_bytes(png(32, 8, 8, 6) + b"more")
+    mtime = status.mtime + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+    status = tl.check_file_status(str(path))
+    assert status.status == 'MODIFIED'
+    assert status.info == tl.ImageInfo("PNG", 32, 8, 4, 8)
+
+    assert tl.check_file_status(str(tmp_path / "gone.png")).info is None
@@ -0,0 +1,96 @@
+######################################################################
+# changing folders
+
+import os
+
+import fake_bpy
+
+
+def count_scandir(tl, monkeypatch):
+    listed = []
+    scandir = os.scandir
+
+    def counted(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(tl.os, "scandir", counted)
+    return listed
+
+
+# each folder is listed once however many files are in it
+
+def test_existing_files(tl, tmp_path, monkeypatch):
+    paths = []
+    for folder in ("a", "b", os.path.join("b", "c")):
+        os.makedirs(tmp_path / folder)
+        for i in range(20):
+            path = str(tmp_path / folder / f"tex{i}.png")
+            if i % 3:
+                open(path, "wb").close()
+            paths.append(path)
+    paths.append(str(tmp_path / "gone" / "tex.png"))
+
+    listed = count_scandir(tl, monkeypatch)
+    found = tl.existing_files(paths)
+
+    assert sorted(listed) == sorted(str(tmp_path / f) for f in (
+        "a", "b", os.path.join("b", "c"), "gone"))
+    assert found == set(p for p in paths if os.path.exists(p))
+
+
+# moving a whole folder tree lists each new folder once
+
+def test_change_folder(tl, stuff, tmp_path, monkeypatch):
+    root = str(tmp_path)
+    material = fake_bpy.make_material(root, 300, 3)
+    images = tl.scope_images('TREE', material.node_tree)
+    tl.do_scan(stuff, images)
+    old_paths = [img.filepath for img in images]
+    dst = os.path.join(root, "dst")
+
+    listed = count_scandir(tl, monkeypatch)
+    assert tl.change_folder(tl._model["tree"], 0, dst) == 0
+
+    folders = set(os.path.dirname(img.filepath) for img in images)
+    assert sorted(listed) == sorted(folders)
+    src = os.path.join(root, "src")
+    assert [img.filepath for img in images] == [
+        dst + p[len(src):] for p in old_paths]
+
+
+def image(bpy, name, filepath):
+    img = bpy.data.images.new(name)
+    img.filepath = filepath
+    return img
+
+
+# paths which are the same folder (with '..' in, or differently cased
+# on Windows) are one node so changing its folder changes all of them
+
+def test_same_folder_spellings(tl, stuff, tmp_path, monkeypatch):
+    bpy = fake_bpy.install()
+    root = str(tmp_path)
+    for folder in ("t", "s", "new"):
+        os.makedirs(os.path.join(root, folder))
+    open(os.path.join(root, "new", "a.png"), "wb").close()
+
+    # everything is case insensitive like Windows
+    monkeypatch.setattr(tl.os.path, "normcase", str.lower)
+    images = [image(bpy, "dotted", os.path.join(root, "s", "..", "t",
+                                                  "a.png")),
+              image(bpy, "plain", os.path.join(root, "t", "a.png")),
+              image(bpy, "upper", os.path.join(root, "T", "A.png"))]
+    tl.do_scan(stuff, images)
+
+    tree = tl._model["tree"]
+    assert [(n.is_folder, n.filepath) for n in tree.nodes] == [
+        (True, os.path.join(root, "t")),
+        (False, os.path.join(root, "t", "a.png"))]
+    assert len(set(n.key for n in tree.nodes)) == len(tree)
+    assert [img.img for img in stuff.list_items[1].images] == images
+
+    new = os.path.join(root, "new")
+    assert tl.change_folder(tree, 0, new) == 0
+    assert [img.filepath for img in images] == [
+        os.path.join(new, "a.png")] * 3
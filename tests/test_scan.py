@@ -0,0 +1,77 @@
+######################################################################
+# scanning images into the list
+
+import os
+import time
+
+import fake_bpy
+
+
+# count images in a few big folders, each used by two nodes
+
+def make_images(root, count, folders=4):
+    bpy = fake_bpy.install()
+    images = []
+    for i in range(count):
+        img = bpy.data.images.new(f"tex{i}")
+        img.filepath = os.path.join(root, f"folder{i % folders}",
+                                    f"tex{i}.png")
+        images.append(img)
+    return images + images[::-1]
+
+
+def best_scan_time(tl, s, images, repeat=5):
+    best = None
+    for _ in range(repeat):
+        s.list_items.clear()
+        tl._model["tree"] = tl.TextureTree()
+        start = time.perf_counter()
+        tl.do_scan(s, images)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+# scan time grows linearly with the number of images (8 times as many
+# images would take 64 times as long if it was quadratic)
+
+def test_scan_is_linear(tl, stuff, tmp_path):
+    small = make_images(str(tmp_path), 1000)
+    large = make_images(str(tmp_path), 8000)
+
+    small_time = best_scan_time(tl, stuff, small)
+    large_time = best_scan_time(tl, stuff, large)
+    assert len(stuff.list_items) == 8000 + 4
+
+    assert large_time / small_time < 20
+
+
+# a refresh only touches the rows which changed (counting property
+# writes and collection changes), and keeps the expanded state
+
+def test_refresh_rna_ops(tl, stuff, tmp_path):
+    bpy = fake_bpy.install()
+    images = make_images(str(tmp_path), 1000)
+    rna = fake_bpy.rna
+
+    rna["ops"] = 0
+    tl.do_scan(stuff, images)
+    full = rna["ops"]
+    assert full > len(stuff.list_items)
+
+    # nothing changed
+    stuff.list_items[0].expanded = False
+    rna["ops"] = 0
+    tl.do_scan(stuff, images)
+    assert rna["ops"] < 10
+    assert not stuff.list_items[0].expanded
+
+    # one more file (rows after it only have their index changed)
+    img = bpy.data.images.new("new")
+    img.filepath = os.path.join(str(tmp_path), "folder3", "new.png")
+    rna["ops"] = 0
+    tl.do_scan(stuff, images + [img])
+    assert rna["ops"] < full / 10
+    assert not stuff.list_items[0].expanded
+    assert [item.path for item in stuff.list_items] == [
+        node.path for node in tl._model["tree"].nodes]
@@ -0,0 +1,81 @@
+######################################################################
+# finding the images used by node trees
+
+from types import SimpleNamespace
+
+import fake_bpy
+
+
+class CountedNodes(fake_bpy.Nodes):
+
+    """ Nodes which count how many times they're walked """
+
+    walks = 0
+
+    def __iter__(self):
+        CountedNodes.walks += 1
+        return super().__iter__()
+
+
+def counted_tree(bpy, name, images):
+    node_tree = bpy.data.node_groups.new(name)
+    node_tree.nodes = CountedNodes()
+    for img in images:
+        node_tree.nodes.new("ShaderNodeTexImage").image = img
+    return node_tree
+
+
+def depsgraph(*changed):
+    return SimpleNamespace(updates=[SimpleNamespace(id=data)
+                                    for data in changed])
+
+
+# each tree is walked once until the depsgraph says it's changed, and
+# then only that tree is walked again
+
+def test_tree_contents(tl, stuff):
+    bpy = fake_bpy.install()
+    a, b, c = (bpy.data.images.new(name) for name in "abc")
+    group = counted_tree(bpy, "group", [b])
+    material = bpy.data.materials.new("material")
+    material.node_tree.nodes = CountedNodes()
+    material.node_tree.nodes.new("ShaderNodeTexImage").image = a
+    material.node_tree.nodes.new("ShaderNodeGroup").node_tree = group
+    CountedNodes.walks = 0
+
+    for i in range(4):
+        assert tl.scope_images('RECURSIVE', material.node_tree) == [a, b]
+    assert CountedNodes.walks == 2
+
+    # adding a node to the group
+    group.nodes.new("ShaderNodeTexImage").image = c
+    tl.on_depsgraph_update(None, depsgraph(group))
+    assert tl.scope_images('RECURSIVE', material.node_tree) == [a, b, c]
+    assert CountedNodes.walks == 3
+
+    # the material's tree is reported as the material
+    material.node_tree.nodes[0].image = c
+    tl.on_depsgraph_update(None, depsgraph(material))
+    assert tl.scope_images('MATERIALS', None) == [c, b, c]
+    assert CountedNodes.walks == 4
+
+    # something else changing doesn't matter
+    tl.on_depsgraph_update(None, depsgraph(a))
+    tl.scope_images('RECURSIVE', material.node_tree)
+    assert CountedNodes.walks == 4
+
+    # after an undo everything is walked again
+    tl.on_undo_redo(None)
+    tl.scope_images('RECURSIVE', material.node_tree)
+    assert CountedNodes.walks == 6
+
+
+# images which have been removed are left out
+
+def test_removed_image(tl, stuff):
+    bpy = fake_bpy.install()
+    a, b = (bpy.data.images.new(name) for name in "ab")
+    node_tree = counted_tree(bpy, "tree", [a, b])
+    assert tl.scope_images('TREE', node_tree) == [a, b]
+    bpy.data.images.remove(a)
+    assert tl.scope_images('TREE', node_tree) == [b]
@@ -0,0 +1,47 @@
+######################################################################
+# file status checks
+
+import os
+
+import fake_bpy
+
+from test_headers import png
+
+
+def wait_for_status(tl):
+    for f in list(tl._status_check["pending"]):
+        f.result()
+    tl.apply_status_results()
+
+
+# two spellings of the same file are one row which gets the status,
+# header info and memory (and so do the folder totals)
+
+def test_status_for_same_file(tl, stuff, tmp_path):
+    bpy = fake_bpy.install()
+    root = str(tmp_path)
+    os.makedirs(os.path.join(root, "s"))
+    os.makedirs(os.path.join(root, "t"))
+    with open(os.path.join(root, "t", "a.png"), "wb") as f:
+        f.write(png(64, 32, 8, 6))
+    images = []
+    for name, path in (("dotted", os.path.join("s", "..", "t", "a.png")),
+                       ("plain", os.path.join("t", "a.png")),
+                       ("missing", os.path.join("t", "b.png"))):
+        img = bpy.data.images.new(name)
+        img.filepath = os.path.join(root, path)
+        images.append(img)
+
+    tl.do_scan(stuff, images)
+    wait_for_status(tl)
+
+    tree = tl._model["tree"]
+    assert [n.label for n in tree.nodes] == [os.path.join(root, "t"),
+                                             "a.png", "b.png"]
+    assert [item.status for item in stuff.list_items[1:]] == [
+        'PRESENT', 'MISSING']
+    assert tree.missing == {2}
+    assert tl.file_status(images[0].filepath).info == tl.ImageInfo(
+        "PNG", 64, 32, 4, 8)
+    assert [item.memory for item in stuff.list_items] == [
+        64 * 32 * 4, 64 * 32 * 4, 0]
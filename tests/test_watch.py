@@ -0,0 +1,71 @@
+######################################################################
+# watching files for changes
+
+import os
+
+from types import SimpleNamespace
+
+import pytest
+
+import fake_bpy
+
+
+@pytest.fixture
+def watching(tl, stuff, monkeypatch):
+    prefs = SimpleNamespace(**tl.PREFERENCE_DEFAULTS)
+    prefs.watch_files = True
+    monkeypatch.setattr(tl, "get_prefs", lambda context: prefs)
+    yield prefs
+    tl.reset_file_watch()
+
+
+def watch_all(tl):
+    while True:
+        tl.poll_file_watch()
+        future = tl._file_watch["pending"]
+        future.result()
+        if tl._file_watch["next"] >= len(tl._file_watch["paths"]):
+            tl.poll_file_watch()
+            return
+
+
+def make_images(root, names):
+    bpy = fake_bpy.install()
+    images = []
+    for name in names:
+        path = os.path.join(root, name)
+        with open(path, "wb") as f:
+            f.write(b"old")
+        img = bpy.data.images.new(name)
+        img.filepath = path
+        images.append(img)
+    return images
+
+
+# a changed file is reloaded (quietly)
+
+def test_reload(tl, stuff, watching, tmp_path, capsys):
+    images = make_images(str(tmp_path), ["a.png", "b.png"])
+    tl.do_scan(stuff, images)
+    watch_all(tl)
+
+    with open(images[0].filepath, "wb") as f:
+        f.write(b"changed")
+    watch_all(tl)
+
+    assert [img.reloads for img in images] == [1, 0]
+    assert capsys.readouterr().out == ""
+
+
+# files which aren't in the list any more are forgotten on a rescan
+
+def test_known_pruned(tl, stuff, watching, tmp_path):
+    images = make_images(str(tmp_path), ["a.png", "b.png", "c.png"])
+    tl.do_scan(stuff, images)
+    watch_all(tl)
+    assert len(tl._file_watch["known"]) == 3
+
+    tl.do_scan(stuff, images[:1])
+    tl.poll_file_watch()
+    assert list(tl._file_watch["known"]) == [
+        os.path.normpath(images[0].filepath)]
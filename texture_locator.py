@@ -41,19 +41,59 @@
 #    Change Folder
 #        change all sources in a folder (recursively), any missing images
 #        will be left unchanged
+#
+#    Locate Missing
+#        search the folders set in the preferences for missing files
+#
+#    Find Duplicates
+#        find files with the same contents, the images using them can be
+#        changed to all use one of them
+#
+# Batch mode
+#
+#    blender -b --python texture_locator.py -- --report report.json
+#        [--remap remap.json] [--save] [--jobs N] [--scope SCOPE]
+#        file.blend [file.blend...]
+#
+#    writes a JSON report of the image files used by each .blend file
+#    and optionally changes folders according to a remap table (a JSON
+#    object of old folder -> new folder), each .blend file is done by
+#    a separate Blender process
+#
+# Benchmarks
+#
+#    scanning, filtering, drawing, selecting and changing folder are
+#    timed for synthetic node trees by pytest without Blender (see
+#    tests/conftest.py and the readme)
 
 import os
+import re
+import sys
+import json
+import hashlib
+import struct
+import subprocess
+import tempfile
+import time
 import bpy
 
+from collections import OrderedDict, namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from types import SimpleNamespace
+
 import bpy.utils.previews
 
 from bpy.props import (StringProperty,
+                       EnumProperty,
                        IntProperty,
+                       FloatProperty,
                        CollectionProperty,
                        BoolProperty,
                        PointerProperty)
 
 from bpy.types import (PropertyGroup,
+                       AddonPreferences,
                        UIList,
                        Operator,
                        Image,
@@ -76,6 +116,535 @@ bl_info = {
     "tracker_url": ""
 }
 
+######################################################################
+# timing of the hot paths, switched on from the Diagnostics panel
+
+# when it's off timed() returns a shared do-nothing context manager so
+# the cost is a dict lookup
+
+_timing = {
+
+    # recording timings?
+    "enabled": False,
+
+    # total time spent in draw_item during the current template_list
+    "draw_item": 0.0
+}
+
+# name -> recent durations in seconds
+_timings = {}
+
+# how many recent durations to keep for each timer
+TIMING_HISTORY = 100
+
+
+class Timer:
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        record_time(self.name, time.perf_counter() - self.start)
+
+
+class NoTimer:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_no_timer = NoTimer()
+
+######################################################################
+# time a block - with timed("name"): ...
+
+
+def timed(name):
+    return Timer(name) if _timing["enabled"] else _no_timer
+
+######################################################################
+# decorator to time an operator's execute() - the wrapper has to have
+# the same arguments because Blender checks them when registering
+
+
+def timed_execute(name):
+    def decorate(execute):
+        def wrapper(self, context):
+            with timed(name):
+                return execute(self, context)
+        wrapper.__doc__ = execute.__doc__
+        return wrapper
+    return decorate
+
+######################################################################
+# add a duration to the rolling stats for a timer
+
+
+def record_time(name, seconds):
+    history = _timings.get(name)
+    if history is None:
+        history = _timings[name] = deque(maxlen=TIMING_HISTORY)
+    history.append(seconds)
+
+######################################################################
+# {name: {count, last, mean, max}} (all in ms) for the recent timings
+
+
+def timing_stats():
+    stats = {}
+    for name, history in sorted(_timings.items()):
+        stats[name] = {
+            "count": len(history),
+            "last": history[-1] * 1000,
+            "mean": sum(history) / len(history) * 1000,
+            "max": max(history) * 1000
+        }
+    return stats
+
+######################################################################
+# switch timing on/off (update callback for MyStuff.record_timings)
+
+
+def record_timings_changed(self, context):
+    _timing["enabled"] = self.record_timings
+
+######################################################################
+# the tree of folders and files is kept as plain Python objects which
+# scanning, selection and remapping all work on, the ListItems in
+# MyStuff.list_items are just a copy of it for the UIList to show
+
+# it doesn't use bpy (images are referred to by their as_pointer()
+# values) so it's cheap to look at and works outside Blender
+
+
+class TreeNode:
+
+    __slots__ = ("key", "is_folder", "path", "label", "filepath",
+                 "index", "parent", "depth", "subtree_end", "pointers",
+                 "duplicate", "memory")
+
+    def __init__(self, key, is_folder, path, label, filepath,
+                 parent, depth, pointers):
+
+        # identifies the folder/file, stays the same across scans
+        self.key = key
+
+        # True if this is a folder rather than a file
+        self.is_folder = is_folder
+
+        # full path for folders, just filename for files
+        self.path = path
+
+        # text shown in the UIList - whole path for root folders, path
+        # relative to the parent for other folders, filename for files
+        self.label = label
+
+        # full path for folders and files
+        self.filepath = filepath
+
+        # index of this node, its parent (-1 for root nodes) and the
+        # first node after it which isn't one of its children (so the
+        # children of node i are nodes[i + 1:subtree_end])
+        self.index = 0
+        self.parent = parent
+        self.subtree_end = 0
+
+        # how many folders above this one (0 for root nodes)
+        self.depth = depth
+
+        # as_pointer() of the images which use this file
+        self.pointers = pointers
+
+        # which group of duplicate files this is in (numbered from 1, 0
+        # if it's not a duplicate), see TextureTree.set_duplicates()
+        self.duplicate = 0
+
+        # estimated bytes when the image is loaded, for folders it's the
+        # total for everything under them (see TextureTree.update_memory)
+        self.memory = 0
+
+
+class TextureTree:
+
+    def __init__(self, nodes=()):
+
+        # folders come before their children and a folder's children
+        # are directly after it
+        self.nodes = list(nodes)
+
+        # work out where each subtree ends, one pass backwards pushes
+        # the ends up the tree
+        for i, node in enumerate(self.nodes):
+            node.index = i
+            node.subtree_end = i + 1
+        for node in reversed(self.nodes):
+            p = node.parent
+            if p != -1 and node.subtree_end > self.nodes[p].subtree_end:
+                self.nodes[p].subtree_end = node.subtree_end
+
+        # key -> index
+        self.by_key = {node.key: node.index for node in self.nodes}
+
+        # expanded state of each folder (ListItem.expanded is the copy
+        # the UIList changes)
+        self.expanded = [True] * len(self.nodes)
+
+        # cached UIList filter flags (None until they're needed) and the
+        # value of UIList.bitflag_filter_item they were made with
+        self.flags = None
+        self.show = 0
+
+        # identity order for the UIList, the order never changes
+        self.order = list(range(len(self.nodes)))
+
+        # normpath'd filepath -> index for files, made when needed
+        self.file_index = None
+
+        # SearchIndex of the labels for the UIList filter (made at scan
+        # time by index_labels())
+        self.search = None
+
+        # indices of the files which were found to be missing
+        self.missing = set()
+
+        # [(size, [indices])] for each group of files with the same
+        # contents and the indices of all the files in them
+        self.duplicate_groups = []
+        self.duplicates = set()
+
+        # estimated memory of each file from the file status checks
+        # (0 for folders), set_memory() marks the totals as stale
+        self.file_memory = [0] * len(self.nodes)
+        self.memory_stale = False
+
+        # UIList order with the children of each folder sorted biggest
+        # first, made when it's needed
+        self.sorted_order = None
+
+        # cached flags for the last search and what it was
+        self.filtered = None
+        self.filter_key = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # make the tree from {folder -> {filename -> [images]}}
+
+    @classmethod
+    def from_paths(cls, paths):
+
+        nodes = []
+
+        # folder_key(path) -> index of folders added so far
+        folders = {}
+
+        # sorted list of paths so parents come before children
+        for p in sorted(paths.keys(), key=folder_sort_key):
+
+            index = len(nodes)
+
+            # find closest parent folder (or -1 if it's a root path)
+            key = folder_key(p)
+            parent = find_parent_folder(folders, p)
+            folders[key] = index
+            depth = 0 if parent == -1 else nodes[parent].depth + 1
+
+            # root folders show whole path, children show relative paths
+            label = p
+            if parent != -1:
+                label = os.path.relpath(p, nodes[parent].path)
+
+            nodes.append(TreeNode((key, ""), True, p, label, p,
+                                  parent, depth, ()))
+
+            # add the files in that folder, sorted so the order is the
+            # same every time (needed to compare with the last scan)
+            for filename, images in sorted(paths[p].items()):
+                nodes.append(TreeNode(
+                    (key, filename), False, filename, filename,
+                    os.path.join(p, filename), index, depth + 1,
+                    tuple(i.as_pointer() for i in images)))
+
+        return cls(nodes)
+
+    # index of the node with a key, -1 if it's not there
+
+    def find(self, key):
+        return self.by_key.get(key, -1)
+
+    # the file nodes under a folder (or in the whole tree)
+
+    def files(self, index=-1):
+        if index == -1:
+            nodes = self.nodes
+        else:
+            nodes = self.nodes[index + 1:self.nodes[index].subtree_end]
+        return [node for node in nodes if not node.is_folder]
+
+    # index of the file with a (normpath'd) filepath, -1 if not there
+    # (filepaths are unique, see group_images)
+
+    def find_file(self, filepath):
+        if self.file_index is None:
+            self.file_index = {os.path.normpath(node.filepath): node.index
+                               for node in self.nodes if not node.is_folder}
+        return self.file_index.get(filepath, -1)
+
+    # make the index used to filter the UIList by name
+
+    def index_labels(self):
+        self.search = SearchIndex(node.label for node in self.nodes)
+
+    # record whether a file is missing
+
+    def set_missing(self, index, missing):
+        if missing != (index in self.missing):
+            if missing:
+                self.missing.add(index)
+            else:
+                self.missing.discard(index)
+            self.filtered = None
+
+    # record the estimated memory of a file
+
+    def set_memory(self, index, memory):
+        if self.file_memory[index] != memory:
+            self.file_memory[index] = memory
+            self.memory_stale = True
+
+    # work out the folder totals in one pass backwards, children come
+    # after their parents so each node's total is finished before it's
+    # added to its parent
+
+    # returns the indices of the nodes whose memory changed
+
+    def update_memory(self):
+        if not self.memory_stale:
+            return []
+        self.memory_stale = False
+
+        nodes = self.nodes
+        totals = list(self.file_memory)
+        for node in reversed(nodes):
+            if node.parent != -1:
+                totals[node.parent] += totals[node.index]
+
+        changed = [i for i in range(len(nodes))
+                   if nodes[i].memory != totals[i]]
+        for i in changed:
+            nodes[i].memory = totals[i]
+        if changed:
+            self.sorted_order = None
+        return changed
+
+    # UIList order (new position of each node) which keeps the tree but
+    # puts the children of each folder in order of memory, biggest first
+
+    def size_order(self):
+        if self.sorted_order is None:
+            nodes = self.nodes
+
+            def biggest_first(indices):
+                return sorted(indices, key=lambda i: -nodes[i].memory)
+
+            roots = []
+            children = [[] for _ in nodes]
+            for node in nodes:
+                if node.parent == -1:
+                    roots.append(node.index)
+                else:
+                    children[node.parent].append(node.index)
+
+            # depth first, the stack is reversed so the biggest is next
+            order = [0] * len(nodes)
+            position = 0
+            stack = biggest_first(roots)[::-1]
+            while stack:
+                i = stack.pop()
+                order[i] = position
+                position += 1
+                stack += biggest_first(children[i])[::-1]
+            self.sorted_order = order
+        return self.sorted_order
+
+    # mark the files which are duplicates from [(size, [paths])] (see
+    # find_duplicates), paths which aren't in the tree are ignored
+
+    def set_duplicates(self, groups):
+        for node in self.nodes:
+            node.duplicate = 0
+        self.duplicate_groups = []
+        self.duplicates = set()
+        for size, paths in groups:
+            indices = [i for i in map(self.find_file, paths) if i != -1]
+            if len(indices) > 1:
+                self.duplicate_groups.append((size, indices))
+                for i in indices:
+                    self.nodes[i].duplicate = len(self.duplicate_groups)
+                self.duplicates.update(indices)
+        self.filtered = None
+
+    # get the UIList filter flags, they're only worked out when the tree
+    # changes and patched when a folder is expanded/collapsed
+
+    def visibility(self, show, pattern="", missing_only=False,
+                   duplicates_only=False):
+        if pattern or missing_only or duplicates_only:
+            return self.filter(show, pattern, missing_only,
+                               duplicates_only)
+        if self.flags is None or self.show != show:
+            self.show = show
+            self.flags = [0] * len(self.nodes)
+            self.update_visibility(0, len(self.nodes))
+        return self.flags
+
+    # work out filter flags for nodes[first:last], parents of those
+    # nodes must already be up to date - a node is visible if its
+    # parent is visible and expanded
+
+    def update_visibility(self, first, last):
+        flags = self.flags
+        expanded = self.expanded
+        show = self.show
+        nodes = self.nodes
+        for i in range(first, last):
+            p = nodes[i].parent
+            if p == -1 or (flags[p] and expanded[p]):
+                flags[i] = show
+            else:
+                flags[i] = 0
+
+    # get the UIList filter flags when searching, the rows which match
+    # (see SearchIndex) and/or are missing/duplicate files are shown
+    # along with the folders above them - whether the folders are
+    # expanded doesn't matter so nothing which matches is hidden
+
+    def filter(self, show, pattern, missing_only, duplicates_only):
+        key = (show, pattern, missing_only, duplicates_only)
+        if self.filtered is None or self.filter_key != key:
+            rows = None
+            if pattern:
+                if self.search is None:
+                    self.index_labels()
+                rows = self.search.match(pattern)
+            for only, subset in ((missing_only, self.missing),
+                                 (duplicates_only, self.duplicates)):
+                if only:
+                    rows = (subset if rows is None
+                            else [i for i in rows if i in subset])
+
+            # mark the rows and their parents, stopping at any parent
+            # which has already been done
+            flags = [0] * len(self.nodes)
+            nodes = self.nodes
+            for i in rows:
+                while i != -1 and not flags[i]:
+                    flags[i] = show
+                    i = nodes[i].parent
+
+            self.filtered = flags
+            self.filter_key = key
+        return self.filtered
+
+    # expand/collapse a folder and patch the flags of its children
+
+    def set_expanded(self, index, expanded):
+        self.expanded[index] = expanded
+        if self.flags is not None:
+            self.update_visibility(index + 1, self.nodes[index].subtree_end)
+
+
+######################################################################
+# index of the lowercased labels of a tree for the UIList filter, made
+# at scan time so each keystroke only looks at the rows which could
+# match rather than every row
+
+# each 3 character substring (trigram) of a label maps to the rows
+# which contain it, so the only rows which can contain a search string
+# are the ones which contain all of its trigrams
+
+# searches with * ? or [ in them are globs (like the file browser) and
+# anything else is a substring search
+
+GLOB_CHARS = "*?["
+
+# the wildcard parts of a glob, what's left are the literal parts
+GLOB_WILDCARDS = re.compile(r"\*|\?|\[!?\]?[^\]]*\]?")
+
+
+class SearchIndex:
+
+    def __init__(self, labels):
+
+        # lowercase label of each row
+        self.keys = [label.lower() for label in labels]
+
+        # trigram -> rows which contain it, in order
+        self.trigrams = {}
+        for i, key in enumerate(self.keys):
+            for gram in set(key[j:j + 3] for j in range(len(key) - 2)):
+                self.trigrams.setdefault(gram, []).append(i)
+
+    # rows which contain all the trigrams of some (lowercase) strings,
+    # None if the strings are too short to rule anything out
+
+    def candidates(self, parts):
+        grams = set(p[j:j + 3] for p in parts for j in range(len(p) - 2))
+        if not grams:
+            return None
+
+        # start with the smallest, it's usually tiny
+        postings = sorted((self.trigrams.get(g, ()) for g in grams),
+                          key=len)
+        rows = set(postings[0])
+        for posting in postings[1:]:
+            if not rows:
+                break
+            rows.intersection_update(posting)
+        return rows
+
+    # rows whose labels match a search string
+
+    def match(self, pattern):
+        pattern = pattern.lower()
+        if any(c in pattern for c in GLOB_CHARS):
+            parts = GLOB_WILDCARDS.split(pattern)
+
+            def test(key):
+                return fnmatchcase(key, pattern)
+        else:
+            parts = [pattern]
+
+            def test(key):
+                return pattern in key
+
+        rows = self.candidates(parts)
+        if rows is None:
+            rows = range(len(self.keys))
+        keys = self.keys
+        return [i for i in rows if test(keys[i])]
+
+
+# the current tree
+_model = {"tree": TextureTree()}
+
+######################################################################
+# update callback for ListItem.expanded
+
+
+def expanded_changed(self, context):
+    tree = _model["tree"]
+    if self.index < len(tree):
+        tree.set_expanded(self.index, self.expanded)
+
 ######################################################################
 # jumping through hoops to make UIList behave like a TreeView
 
@@ -86,487 +655,2663 @@ class ImagePointer(PropertyGroup):
     img: PointerProperty(type=Image)
 
 
-class ListItem(PropertyGroup):
+# these are a copy of what's in the TextureTree (see above)
+
 
-    # index of parent node or -1 for root items
-    parent: IntProperty()
+class ListItem(PropertyGroup):
 
     # full path for folders, just filename for images
     path: StringProperty()
 
+    # text shown in the UIList - whole path for root folders, path
+    # relative to the parent for other folders, filename for images
+    label: StringProperty()
+
     # True if this item is a folder rather than a file
     is_folder: BoolProperty()
 
     # is this item expanded? Only meaningful for folders
-    expanded: BoolProperty(default=True)
+    expanded: BoolProperty(default=True, update=expanded_changed)
+
+    # index of this item in the list
+    index: IntProperty()
+
+    # how many folders above this one (0 for root items)
+    depth: IntProperty()
+
+    # group of duplicate files this is in (see TreeNode), 0 if none
+    duplicate: IntProperty()
+
+    # estimated bytes when loaded (total for folders), 0 if not known
+    memory: FloatProperty()
 
     # all the Image node which reference this file
     images: CollectionProperty(type=ImagePointer)
 
+    # state of the file on disk (see check_file_status), files only
+    status: EnumProperty(
+        items=[
+            ('UNKNOWN', "Unknown", "Not checked yet"),
+            ('PRESENT', "Present", "File exists"),
+            ('MISSING', "Missing", "File not found"),
+            ('MODIFIED', "Modified", "File has changed since it was "
+             "first seen")],
+        default='UNKNOWN')
+
 ######################################################################
 # one instance of MyStuff is stored in (of all places) context.window_manager
 
 # don't want to put it in context.scene because it's not supposed to be
 # persistent, just working storage that can be used to display a UIList
 
-# if anyone has any better ideas about where to keep this and still make
-# it accessible from a UIList I'm all ears
+# if anyone has any better ideas about where to keep this and still make
+# it accessible from a UIList I'm all ears
+
+
+class MyStuff(PropertyGroup):
+
+    # the items in the UIList
+    list_items: CollectionProperty(type=ListItem)
+
+    # the index of the selected item in the UIList
+    list_index: IntProperty(default=-1, name=" ")
+
+    # which images to show
+    scope: EnumProperty(
+        name="Scope",
+        description="Which images to show",
+        items=[
+            ('TREE', "Node Tree",
+             "Images used by the node tree being edited"),
+            ('RECURSIVE', "Node Tree and Groups",
+             "Images used by the node tree being edited and any node "
+             "groups inside it"),
+            ('MATERIALS', "All Materials",
+             "Images used by any material (including node groups)"),
+            ('IMAGES', "All Images",
+             "Every image in the file")],
+        default='TREE',
+        update=lambda self, context: request_check())
+
+    # time the hot paths for the Diagnostics panel
+    record_timings: BoolProperty(
+        name="Record timings",
+        description="Time scanning, drawing and operators (slightly "
+                    "slower)",
+        update=record_timings_changed)
+
+######################################################################
+# add-on preferences, these are persistent
+
+# defaults are kept separately so get_prefs() can still return something
+# sensible when the script is run from the text editor rather than
+# installed as an add-on
+
+
+PREFERENCE_DEFAULTS = {
+    "preview_cache_count": 64,
+    "preview_cache_mb": 32,
+    "scan_cache_count": 16,
+    "scan_cache_mb": 16,
+    "search_roots": "",
+    "match_size": True,
+    "watch_files": False,
+    "watch_batch_size": 100
+}
+
+
+class TextureLocatorPreferences(AddonPreferences):
+
+    bl_idname = __name__
+
+    # max number of image previews to keep loaded
+    preview_cache_count: IntProperty(
+        name="Preview cache size",
+        description="Maximum number of image previews to keep loaded",
+        min=1,
+        default=PREFERENCE_DEFAULTS["preview_cache_count"])
+
+    # max (estimated) memory for image previews
+    preview_cache_mb: IntProperty(
+        name="Preview cache memory (MB)",
+        description="Maximum memory to use for image previews",
+        min=1,
+        default=PREFERENCE_DEFAULTS["preview_cache_mb"])
+
+    # max number of scans to keep for switching back to
+    scan_cache_count: IntProperty(
+        name="Scan cache size",
+        description="Maximum number of recent scans to keep, switching "
+                    "back to one of them doesn't need a rescan",
+        min=1,
+        default=PREFERENCE_DEFAULTS["scan_cache_count"])
+
+    # max (estimated) memory for the kept scans
+    scan_cache_mb: IntProperty(
+        name="Scan cache memory (MB)",
+        description="Maximum memory to use for recent scans",
+        min=1,
+        default=PREFERENCE_DEFAULTS["scan_cache_mb"])
+
+    # where Locate Missing looks for files
+    search_roots: StringProperty(
+        name="Search folders",
+        description="Folders (and their subfolders) searched by Locate "
+                    f"Missing, separated by '{os.pathsep}'",
+        default=PREFERENCE_DEFAULTS["search_roots"])
+
+    # only relink to files which are the same size (when it's known)
+    match_size: BoolProperty(
+        name="Match file size",
+        description="When the size of a missing file is known, only "
+                    "relink it to a file of the same size",
+        default=PREFERENCE_DEFAULTS["match_size"])
+
+    # watch the files in the list and reload the ones which change
+    watch_files: BoolProperty(
+        name="Reload changed files",
+        description="Keep checking the files in the list and reload "
+                    "images when their files change",
+        default=PREFERENCE_DEFAULTS["watch_files"],
+        update=lambda self, context: start_file_watch())
+
+    # how many files the watcher checks each time
+    watch_batch_size: IntProperty(
+        name="Files per check",
+        description="How many files are checked each time the watcher "
+                    "runs (twice a second)",
+        min=1,
+        default=PREFERENCE_DEFAULTS["watch_batch_size"])
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.prop(self, "preview_cache_count")
+        row.prop(self, "preview_cache_mb")
+        row = layout.row()
+        row.prop(self, "scan_cache_count")
+        row.prop(self, "scan_cache_mb")
+        layout.prop(self, "search_roots")
+        layout.prop(self, "match_size")
+        row = layout.row()
+        row.prop(self, "watch_files")
+        row.prop(self, "watch_batch_size")
+
+######################################################################
+# get the add-on preferences (or the defaults if not installed)
+
+
+def get_prefs(context):
+    addon = context.preferences.addons.get(__name__)
+    if addon is None:
+        return SimpleNamespace(**PREFERENCE_DEFAULTS)
+    return addon.preferences
+
+######################################################################
+# split a layout into columns based on list of ratios
+
+
+def split_layout(layout, ratios, **kwargs):
+    columns = []
+    for i in range(len(ratios)):
+        layout = layout.split(factor=ratios[i] / sum(ratios[i:]))
+        columns.append(layout.column(**kwargs))
+    return columns
+
+
+######################################################################
+# helper for poll() functions
+
+
+def is_in_shader_node_editor(context):
+    return (context.space_data
+            and context.space_data.type == "NODE_EDITOR"
+            and context.space_data.tree_type == "ShaderNodeTree")
+
+
+######################################################################
+# only show select/move buttons if a valid item is selected
+
+
+def show_select_or_move(context):
+    s = context.window_manager.tl_stuff
+    index = s.list_index
+    items = s.list_items
+    return (is_in_shader_node_editor(context)
+            and len(items) == len(_model["tree"])
+            and 0 <= index < len(items))
+
+######################################################################
+# as_pointer() -> image for all the images
+
+
+def image_lookup():
+    return {img.as_pointer(): img for img in bpy.data.images}
+
+######################################################################
+# get the images with some as_pointer() values (skipping any which
+# have gone), lookup is from image_lookup()
+
+
+def pointer_images(pointers, lookup):
+    return [lookup[p] for p in pointers if p in lookup]
+
+######################################################################
+# normalized version of a folder path for comparing/looking up folders,
+# same normalization as bpy.path.is_subdir() uses
+
+
+def folder_key(path):
+    return os.path.normpath(os.path.normcase(path))
+
+######################################################################
+# sort key for folder paths which keeps all the children of a folder
+# directly after it (plain string sort puts '/a/b-c' between '/a/b'
+# and '/a/b/c')
+
+
+def folder_sort_key(path):
+    return folder_key(path).split(os.sep)
+
+######################################################################
+# find index of the closest folder in folders (a dict of folder_key() ->
+# index) which contains path, or -1 if there isn't one
+
+# walks up the path one folder at a time so it's O(depth) rather
+# than checking every folder seen so far
+
+
+def find_parent_folder(folders, path):
+    path = folder_key(path)
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return -1
+        path = parent
+        index = folders.get(path)
+        if index is not None:
+            return index
+
+######################################################################
+# change image filepath, maintaining relativity if possible
+
+
+def replace_path(image, new_path):
+    if image.filepath[:2] == '//':
+        try:
+            new_path = bpy.path.relpath(new_path)
+        except ValueError:
+            pass
+    image.filepath = new_path
+
+######################################################################
+# listing folders is done on a pool of threads because each listing can
+# be a round trip on a network share
+
+# max threads to use for file system work
+MAX_IO_THREADS = 8
+
+######################################################################
+# get the set of names (normcase'd) in a folder, empty if it can't be
+# read
+
+
+def list_folder(folder):
+    try:
+        with os.scandir(folder) as entries:
+            return set(os.path.normcase(e.name) for e in entries)
+    except OSError:
+        return set()
+
+######################################################################
+# list a bunch of folders in parallel, each one is only listed once
+
+# returns {folder: set of names}
+
+
+def list_folders(folders):
+    folders = list(set(folders))
+    if len(folders) < 2:
+        return {f: list_folder(f) for f in folders}
+    threads = min(MAX_IO_THREADS, len(folders))
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return dict(zip(folders, pool.map(list_folder, folders)))
+
+######################################################################
+# Locate Missing searches for files by name in the search folders from
+# the preferences, walking a big library every time would take ages so
+# there's an index of it on disk
+
+# the index has an entry for each folder:
+#
+#     path: {"mtime": mtime, "files": {name: size}, "folders": [name],
+#            "id": [st_dev, st_ino] or None}
+#
+# a folder's mtime changes when anything is added/removed/renamed in it
+# so only folders whose mtime has changed need to be listed again (but
+# sizes of files which have been overwritten in place can be stale)
+
+FILE_INDEX_VERSION = 2
+
+######################################################################
+# where the index lives
+
+
+def file_index_path():
+    folder = bpy.utils.user_resource('CONFIG', path="texture_locator",
+                                     create=True)
+    return os.path.join(folder, "file_index.json")
+
+######################################################################
+# load the index, empty if it's not there or not readable
+
+
+def load_file_index(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == FILE_INDEX_VERSION:
+            return index["folders"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}
+
+######################################################################
+# save the index (write a temp file and rename so it's never half
+# written)
+
+
+def save_file_index(path, folders):
+    temp = path + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump({"version": FILE_INDEX_VERSION, "folders": folders}, f)
+    os.replace(temp, path)
+
+######################################################################
+# get the index entry for a folder, reusing the old entry if the folder
+# hasn't changed, None if the folder can't be read
+
+# the id tells folders which are reached through more than one path
+# (symlinks, junctions) apart, it's None where the file system doesn't
+# have inode numbers
+
+
+def index_folder(folder, old):
+    try:
+        stat = os.stat(folder)
+        mtime = stat.st_mtime_ns
+        if old is not None and old["mtime"] == mtime:
+            return old
+        folder_id = [stat.st_dev, stat.st_ino] if stat.st_ino else None
+        files = {}
+        folders = []
+        with os.scandir(folder) as entries:
+            for e in entries:
+                try:
+                    if e.is_dir():
+                        folders.append(e.name)
+                    elif e.is_file():
+                        files[e.name] = e.stat().st_size
+                except OSError:
+                    pass
+        return {"mtime": mtime, "files": files, "folders": folders,
+                "id": folder_id}
+    except OSError:
+        return None
+
+######################################################################
+# bring the index up to date for some root folders, a level at a time
+# with the folders in each level done in parallel
+
+# folders which aren't under the roots any more are dropped, and a
+# folder which has already been indexed through another path is only
+# indexed once (otherwise a symlink back up the tree would be followed
+# round and round until the path got too long)
+
+
+def update_file_index(index, roots):
+    updated = {}
+    seen = set()
+    with ThreadPoolExecutor(max_workers=MAX_IO_THREADS) as pool:
+        level = [os.path.normpath(r) for r in roots]
+        while level:
+            level = sorted(set(level).difference(updated))
+            entries = pool.map(lambda f: index_folder(f, index.get(f)),
+                               level)
+            next_level = []
+            for folder, entry in zip(level, entries):
+                if entry is None:
+                    continue
+                if entry["id"] is not None:
+                    folder_id = tuple(entry["id"])
+                    if folder_id in seen:
+                        continue
+                    seen.add(folder_id)
+                updated[folder] = entry
+                next_level.extend(os.path.join(folder, name)
+                                  for name in entry["folders"])
+            level = next_level
+    return updated
+
+######################################################################
+# normcase'd filename -> [(path, size)] for everything in the index
+
+
+def files_by_name(index):
+    names = {}
+    for folder, entry in index.items():
+        for name, size in entry["files"].items():
+            names.setdefault(os.path.normcase(name), []).append(
+                (os.path.join(folder, name), size))
+    return names
+
+######################################################################
+# size of a file according to the index, None if it's not in there
+
+
+def indexed_size(index, path):
+    folder, name = os.path.split(os.path.normpath(path))
+    entry = index.get(folder)
+    return entry["files"].get(name) if entry else None
+
+######################################################################
+# pick the best candidate for a missing file - the one whose path has
+# the most trailing folders in common with the old path (so textures/a
+# and textures/b are told apart), then just the first alphabetically
+
+
+def best_candidate(old_path, candidates):
+
+    def common_tail(path):
+        a = folder_key(old_path).split(os.sep)
+        b = folder_key(path).split(os.sep)
+        n = 0
+        while n < min(len(a), len(b)) and a[-1 - n] == b[-1 - n]:
+            n += 1
+        return n
+
+    return max(sorted(candidates), key=common_tail)
+
+######################################################################
+# search for the missing files (runs on a worker thread so doesn't
+# touch bpy)
+
+# files is [(pointers, path, size)] for every file in the list where
+# size is how big the file should be if that's known (i.e. it's packed)
+
+# returns (number missing, [(pointers, old path, new path)] for the ones
+# which were found)
+
+
+def locate_missing(files, roots, match_size, index_path):
+
+    # find the missing ones (listing each folder once)
+    listings = list_folders(os.path.dirname(f) for p, f, s in files)
+    missing = [(p, f, s) for p, f, s in files
+               if os.path.normcase(os.path.basename(f))
+               not in listings[os.path.dirname(f)]]
+    if not missing:
+        return 0, []
+
+    # bring the index up to date, sizes of missing files are taken
+    # from the old index in case they used to be in there
+    index = load_file_index(index_path)
+    sizes = [s if s is not None else indexed_size(index, f)
+             for p, f, s in missing]
+    index = update_file_index(index, roots)
+    try:
+        save_file_index(index_path, index)
+    except OSError as e:
+        print(f"Warning: Can't save file index: {e}")
+    names = files_by_name(index)
+
+    found = []
+    for (pointers, old_path, _), size in zip(missing, sizes):
+        candidates = names.get(os.path.normcase(
+            os.path.basename(old_path)), [])
+        if match_size and size is not None:
+            candidates = [c for c in candidates if c[1] == size]
+
+        if not candidates:
+            print(f"Warning: Can't locate {old_path}")
+            continue
+
+        found.append((pointers, old_path,
+                      best_candidate(old_path, [c[0] for c in candidates])))
+    return len(missing), found
+
+# background search started by the Locate Missing button and when it
+# started
+_locate = {"future": None, "start": 0.0}
+
+# seconds between checks for the search being done
+LOCATE_INTERVAL = 0.1
+
+######################################################################
+# previews are loaded from the files when they're needed (i.e. when an
+# item is selected) rather than for every file on every scan, and kept
+# in an LRU cache - the least recently used ones are released when
+# there are too many or they're using too much memory
+
+# bpy.utils.previews collection, created in register()
+_previews = None
+
+# key -> estimated bytes for each loaded preview, oldest first
+_preview_lru = OrderedDict()
+
+# previews are 256 x 256 RGBA with a 32 x 32 icon until they've
+# actually loaded and we know the real size
+DEFAULT_PREVIEW_BYTES = (256 * 256 + 32 * 32) * 4
+
+######################################################################
+# estimate memory used by a preview
+
+
+def preview_bytes(preview):
+    w, h = preview.image_size
+    iw, ih = preview.icon_size
+    size = (w * h + iw * ih) * 4
+    return size if size else DEFAULT_PREVIEW_BYTES
+
+######################################################################
+# release least recently used previews until within limits (but always
+# keep the most recent one)
+
+
+def trim_previews(max_count, max_bytes):
+    total = sum(_preview_lru.values())
+    while len(_preview_lru) > 1 and (len(_preview_lru) > max_count
+                                     or total > max_bytes):
+        key, size = _preview_lru.popitem(last=False)
+        total -= size
+        del _previews[key]
+
+######################################################################
+# get (loading if necessary) the preview for an image file
+
+
+def get_preview(context, path):
+    with timed("preview"):
+        return load_preview(context, path)
+
+######################################################################
+# get the preview from the cache or load it
+
+
+def load_preview(context, path):
+    key = folder_key(path)
+    if key in _preview_lru:
+        _preview_lru.move_to_end(key)
+        preview = _previews[key]
+    else:
+        preview = _previews.load(key, path, 'IMAGE')
+
+    # size is known once the preview has been loaded so update it
+    _preview_lru[key] = preview_bytes(preview)
+
+    prefs = get_prefs(context)
+    trim_previews(prefs.preview_cache_count,
+                  prefs.preview_cache_mb * 1024 * 1024)
+    return preview
+
+######################################################################
+# read image dimensions and format from the file header so the panel
+# doesn't have to touch image.size (which makes Blender load the whole
+# image just to find out how big it is)
+
+# what the header says about an image file, bit_depth is per channel
+ImageInfo = namedtuple("ImageInfo", "format width height channels bit_depth")
+
+# path -> (mtime, size, ImageInfo or None)
+_header_cache = {}
+
+######################################################################
+# read a nul terminated string (EXR attribute names etc)
+
+
+def read_cstring(f, max_length=256):
+    s = b""
+    while len(s) < max_length:
+        c = f.read(1)
+        if not c or c == b"\0":
+            break
+        s += c
+    return s
+
+######################################################################
+# PNG - everything is in the IHDR chunk which must come first
+
+
+def read_png_header(f):
+    data = f.read(26)
+    if data[12:16] != b"IHDR":
+        return None
+    width, height, depth, color = struct.unpack(">IIBB", data[16:26])
+
+    # palette images are 8 bit RGB once they're decoded
+    if color == 3:
+        return ImageInfo("PNG", width, height, 3, 8)
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(color)
+    if channels is None:
+        return None
+    return ImageInfo("PNG", width, height, channels, depth)
+
+######################################################################
+# JPEG - skip segments until the start of frame one
+
+
+def read_jpeg_header(f):
+    f.read(2)
+    while True:
+
+        # find the next marker, skipping any padding
+        c = f.read(1)
+        while c and c != b"\xff":
+            c = f.read(1)
+        while c == b"\xff":
+            c = f.read(1)
+        if not c:
+            return None
+        marker = c[0]
+
+        # standalone markers have no length
+        if marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            continue
+
+        # hit the image data (or the end) without finding a frame
+        if marker in (0xd9, 0xda):
+            return None
+
+        length = struct.unpack(">H", f.read(2))[0]
+
+        # SOF0..SOF15 except DHT, JPG and DAC which share the range
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            depth, height, width, channels = struct.unpack(">BHHB", f.read(6))
+            return ImageInfo("JPEG", width, height, channels, depth)
+
+        f.seek(length - 2, os.SEEK_CUR)
+
+######################################################################
+# TGA - no magic number, fixed 18 byte header
+
+
+def read_tga_header(f):
+    data = f.read(18)
+    if len(data) < 18 or data[1] not in (0, 1):
+        return None
+    image_type = data[2]
+    map_bits = data[7]
+    width, height = struct.unpack("<HH", data[12:16])
+    bits = data[16]
+    alpha = data[17] & 0x0f
+
+    # colour mapped images decode to whatever is in the map
+    if image_type in (1, 9):
+        bits = map_bits
+    elif image_type in (3, 11):
+        return ImageInfo("TGA", width, height, 2 if bits == 16 else 1, 8)
+    elif image_type not in (2, 10):
+        return None
+
+    if bits in (15, 16):
+        return ImageInfo("TGA", width, height, 4 if alpha else 3, 5)
+    if bits in (24, 32):
+        return ImageInfo("TGA", width, height, bits // 8, 8)
+    return None
+
+######################################################################
+# OpenEXR - list of attributes, need the channels and dataWindow ones
+
+
+def read_exr_header(f):
+    f.read(8)
+    channels = None
+    window = None
+    while channels is None or window is None:
+        name = read_cstring(f)
+
+        # empty name marks the end of the header
+        if not name:
+            return None
+        kind = read_cstring(f)
+        size = struct.unpack("<i", f.read(4))[0]
+
+        if name == b"channels" and kind == b"chlist":
+            value = f.read(size)
+
+            # name, pixel type, pLinear + 3 reserved, x/y sampling
+            channels = []
+            pos = 0
+            while pos < len(value) and value[pos] != 0:
+                pos = value.index(b"\0", pos) + 1
+                channels.append(struct.unpack_from("<i", value, pos)[0])
+                pos += 16
+
+        elif name == b"dataWindow" and kind == b"box2i":
+            window = struct.unpack("<iiii", f.read(16))
+
+        else:
+            f.seek(size, os.SEEK_CUR)
+
+    if not channels:
+        return None
+
+    # pixel types are UINT (32 bit), HALF (16 bit) and FLOAT (32 bit)
+    depth = max(16 if c == 1 else 32 for c in channels)
+    x0, y0, x1, y1 = window
+    return ImageInfo("EXR", x1 - x0 + 1, y1 - y0 + 1, len(channels), depth)
+
+######################################################################
+# TIFF - need a few tags from the first IFD
+
+
+def read_tiff_header(f):
+    data = f.read(8)
+    endian = "<" if data[:2] == b"II" else ">"
+    f.seek(struct.unpack(endian + "I", data[4:8])[0])
+    count = struct.unpack(endian + "H", f.read(2))[0]
+    entries = f.read(count * 12)
+
+    # ImageWidth, ImageLength, BitsPerSample, SamplesPerPixel
+    tags = {256: None, 257: None, 258: 1, 277: 1}
+    for i in range(count):
+        tag, kind, n, raw = struct.unpack_from(endian + "HHI4s", entries,
+                                               i * 12)
+        if tag not in tags:
+            continue
+
+        # only SHORT and LONG make sense for these tags
+        fmt = {3: "H", 4: "I"}.get(kind)
+        if fmt is None:
+            return None
+        size = struct.calcsize(fmt)
+
+        # values which don't fit in 4 bytes are somewhere else, all we
+        # want is the first one (BitsPerSample is per channel)
+        if n * size > 4:
+            f.seek(struct.unpack(endian + "I", raw)[0])
+            raw = f.read(size)
+        tags[tag] = struct.unpack(endian + fmt, raw[:size])[0]
+
+    width, height, depth, channels = (tags[t] for t in (256, 257, 258, 277))
+    if width is None or height is None:
+        return None
+    return ImageInfo("TIFF", width, height, channels, depth)
+
+######################################################################
+# Radiance HDR - text header then a resolution line like -Y 512 +X 1024
+
+
+def read_hdr_header(f):
+    f.readline(64)
+
+    # header finishes with a blank line
+    for _ in range(256):
+        line = f.readline(1024)
+        if not line:
+            return None
+        if not line.strip():
+            break
+
+    resolution = f.readline(64).split()
+    if len(resolution) != 4:
+        return None
+    size = {resolution[0][1:]: int(resolution[1]),
+            resolution[2][1:]: int(resolution[3])}
+
+    # RGBE decodes to 32 bit float RGB
+    return ImageInfo("HDR", size[b"X"], size[b"Y"], 3, 32)
+
+######################################################################
+# pick a header reader based on the magic number (or extension for TGA)
+
+
+def header_reader(path, magic):
+    if magic.startswith(b"\x89PNG\r\n\x1a\n"):
+        return read_png_header
+    if magic.startswith(b"\xff\xd8"):
+        return read_jpeg_header
+    if magic.startswith(b"\x76\x2f\x31\x01"):
+        return read_exr_header
+    if magic[:4] in (b"II*\0", b"MM\0*"):
+        return read_tiff_header
+    if magic.startswith(b"#?RADIANCE") or magic.startswith(b"#?RGBE"):
+        return read_hdr_header
+    if os.path.splitext(path)[1].lower() in (".tga", ".tpic"):
+        return read_tga_header
+    return None
+
+######################################################################
+# get ImageInfo for an image file or None if it's not something we know
+# how to read, cached until the file changes - stat is the file's
+# os.stat() which the caller already has
+
+
+def read_image_info(path, stat):
+    cached = _header_cache.get(path)
+    if (cached is not None
+            and cached[0] == stat.st_mtime_ns
+            and cached[1] == stat.st_size):
+        return cached[2]
+
+    info = None
+    try:
+        with open(path, "rb") as f:
+            reader = header_reader(path, f.read(16))
+            if reader is not None:
+                f.seek(0)
+                info = reader(f)
+    except (OSError, ValueError, IndexError, KeyError, struct.error):
+        pass
+
+    _header_cache[path] = (stat.st_mtime_ns, stat.st_size, info)
+    return info
+
+######################################################################
+# estimate how much memory an image will use once it's loaded, width x
+# height x channels x bytes per channel (no mipmaps or GPU copies), 0 if
+# there's no header info
+
+
+def image_memory(info):
+    if info is None:
+        return 0
+    return (info.width * info.height * info.channels
+            * max(1, (info.bit_depth + 7) // 8))
+
+######################################################################
+# release the preview for a file (if it's loaded) so it's loaded again
+# next time
+
+
+def forget_preview(path):
+    key = folder_key(path)
+    if key in _preview_lru:
+        del _preview_lru[key]
+        del _previews[key]
+
+######################################################################
+# release all the previews
+
+
+def clear_previews():
+    _preview_lru.clear()
+    if _previews is not None:
+        _previews.clear()
+
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_ChangeFolder(Operator):
+
+    """ Select a new folder for all children of a path """
+
+    bl_idname = "texture_locator.change_folder"
+    bl_label = "Change folder"
+
+    directory: StringProperty()
+
+    @classmethod
+    def poll(cls, context):
+        return show_select_or_move(context)
+
+    @timed_execute("operator: Change folder")
+    def execute(self, context):
+
+        # folder the user selected
+        new_dir = self.properties.directory
+
+        s = context.window_manager.tl_stuff
+
+        # work out what would happen, the panel shows the plan and
+        # nothing changes until it's applied
+        start_remap_plan(plan_folder_change(_model["tree"], s.list_index,
+                                            new_dir))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_ApplyRemap(Operator):
+
+    """ Change the images to the new folder, missing files are skipped """
+
+    bl_idname = "texture_locator.apply_remap"
+    bl_label = "Apply"
+
+    # one undo step for the whole lot
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        plan = _remap["plan"]
+        return (plan is not None and bool(plan.found)
+                and _remap["job"] is None)
+
+    # all in one go (when run from a script)
+
+    @timed_execute("operator: Apply")
+    def execute(self, context):
+        plan = _remap["plan"]
+        _remap["plan"] = None
+        applied, missing = apply_remap_plan(_model["tree"], plan)
+        if missing != 0:
+            self.report({'WARNING'}, f"{missing} files not found")
+        return {'FINISHED'}
+
+    # from the button the images are changed a few at a time on a timer
+    # so Blender doesn't freeze, progress is shown in the status bar and
+    # Esc puts back everything which was changed
+
+    def invoke(self, context, event):
+        plan = _remap["plan"]
+        _remap["plan"] = None
+        job = RemapJob(_model["tree"], plan)
+        _remap["job"] = job
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(RELINK_INTERVAL,
+                                        window=context.window)
+        wm.progress_begin(0, max(len(job.moves), 1))
+        wm.modal_handler_add(self)
+        self.show_progress(context)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        job = _remap["job"]
+
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'INFO'}, "Change folder cancelled")
+            return {'CANCELLED'}
+
+        if event.type == 'TIMER':
+            with timed("relink step"):
+                finished = job.step(RELINK_SLICE)
+            if finished:
+                self.finish(context)
+                finish_remap_job(job)
+                if job.missing != 0:
+                    self.report({'WARNING'},
+                                f"{job.missing} files not found")
+                return {'FINISHED'}
+            self.show_progress(context)
+
+        # nothing else happens until it's done (the images are half
+        # changed)
+        return {'RUNNING_MODAL'}
+
+    # Esc, or Blender cancelled it (e.g. a file was loaded)
+
+    def cancel(self, context):
+        job = _remap["job"]
+        if job is not None:
+            job.rollback()
+        self.finish(context)
+
+    def show_progress(self, context):
+        job = _remap["job"]
+        context.window_manager.progress_update(job.done)
+        context.workspace.status_text_set(
+            f"Changing folder: {job.done} of {len(job.moves)} files "
+            "(Esc to cancel)")
+
+    def finish(self, context):
+        _remap["job"] = None
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        redraw_node_editors()
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_CancelRemap(Operator):
+
+    """ Forget the folder change """
+
+    bl_idname = "texture_locator.cancel_remap"
+    bl_label = "Cancel"
+
+    @classmethod
+    def poll(cls, context):
+        return _remap["plan"] is not None
+
+    def execute(self, context):
+        cancel_remap_plan()
+        return {'FINISHED'}
+
+######################################################################
+# changing a folder is done in two steps, planning works out where
+# every file would go and checks which ones exist (in the background)
+# without changing anything so the panel can show what's going to
+# happen, then applying changes all the images in one go
+
+
+class RemapPlan:
+
+    def __init__(self, old_dir, new_dir, moves):
+
+        self.old_dir = old_dir
+        self.new_dir = new_dir
+
+        # [(node key, new filepath)] for every file in the folder
+        self.moves = moves
+
+        # set of new filepaths which exist, None until checked
+        self.found = None
+
+        # new filepaths which don't exist
+        self.missing = []
+
+        # background check of the new filepaths
+        self.future = None
+
+
+_remap = {
+
+    # the plan the panel is showing
+    "plan": None,
+
+    # the RemapJob being applied
+    "job": None
+}
+
+# seconds between checks for the plan being ready
+REMAP_INTERVAL = 0.1
+
+# how many missing files the panel lists
+REMAP_PREVIEW_ROWS = 5
+
+# seconds between steps of applying a plan and how long each one can
+# take, long enough to get something done and short enough to keep
+# Blender responsive
+RELINK_INTERVAL = 0.01
+RELINK_SLICE = 0.05
+
+######################################################################
+# work out where all the files in the folder at tree.nodes[index] (and
+# its subfolders) would go if it moved to new_dir
+
+
+def plan_folder_change(tree, index, new_dir):
+
+    # this is the folder they want to change
+    folder = tree.nodes[index]
+
+    # (node key, new filepath) for each image file
+    moves = []
+
+    for node in tree.files(index):
+
+        # get relative path from old place
+        relative = os.path.relpath(node.filepath, folder.path)
+
+        # tack it onto the new place
+        moves.append((node.key, os.path.join(new_dir, relative)))
+
+    return RemapPlan(folder.path, new_dir, moves)
+
+######################################################################
+# which of some files exist (listing each folder once rather than
+# checking every file individually), safe to run on a worker thread
+
+
+def existing_files(paths):
+    listings = list_folders(os.path.dirname(p) for p in paths)
+    found = set()
+    for path in paths:
+        folder, name = os.path.split(path)
+        if os.path.normcase(name) in listings[folder]:
+            found.add(path)
+    return found
+
+######################################################################
+# store the results of checking a plan
+
+
+def set_plan_found(plan, found):
+    plan.found = found
+    plan.missing = [f for k, f in plan.moves if f not in found]
+
+######################################################################
+# make a plan the current one and start checking it in the background
+
+
+def start_remap_plan(plan):
+    cancel_remap_plan()
+    _remap["plan"] = plan
+    plan.future = io_pool().submit(existing_files,
+                                   [f for k, f in plan.moves])
+    bpy.app.timers.register(poll_remap_plan, first_interval=REMAP_INTERVAL)
+
+######################################################################
+# timer callback - pick up the results of checking the plan
+
+
+def poll_remap_plan():
+    plan = _remap["plan"]
+    if plan is None or plan.found is not None:
+        return None
+    if not plan.future.done():
+        return REMAP_INTERVAL
+    set_plan_found(plan, plan.future.result())
+    redraw_node_editors()
+    return None
+
+######################################################################
+# forget the current plan
+
+
+def cancel_remap_plan():
+    plan = _remap["plan"]
+    _remap["plan"] = None
+    if plan is not None and plan.future is not None:
+        plan.future.cancel()
+    if bpy.app.timers.is_registered(poll_remap_plan):
+        bpy.app.timers.unregister(poll_remap_plan)
+
+######################################################################
+# applying a plan changes the images for all the files which were found,
+# it can be done a bit at a time (see ApplyRemap) and the old paths are
+# kept so it can be undone if it's cancelled part way through
+
+
+class RemapJob:
+
+    def __init__(self, tree, plan):
+
+        # the tree may have been rescanned since the plan was made so
+        # look the files up by key
+        lookup = image_lookup()
+
+        # [(images, new filepath)] for the files to change
+        self.moves = []
+        for key, newfile in plan.moves:
+            n = tree.find(key)
+            if n != -1 and newfile in plan.found:
+                self.moves.append(
+                    (pointer_images(tree.nodes[n].pointers, lookup),
+                     newfile))
+
+        # how many files won't be changed and the missing ones
+        self.missing = len(plan.moves) - len(self.moves)
+        self.missing_files = plan.missing
+
+        # how many of the moves have been done
+        self.done = 0
+
+        # [(image, old filepath)] for the images changed so far
+        self.old_paths = []
+
+    # do moves for up to budget seconds (at least one)
+
+    # returns True when they're all done
+
+    def step(self, budget):
+        end = time.perf_counter() + budget
+        while self.done < len(self.moves):
+            images, newfile = self.moves[self.done]
+            for img in images:
+                self.old_paths.append((img, img.filepath))
+                replace_path(img, newfile)
+            self.done += 1
+            if time.perf_counter() >= end:
+                break
+        return self.done == len(self.moves)
+
+    # put back the images changed so far
+
+    def rollback(self):
+        for img, filepath in reversed(self.old_paths):
+            img.filepath = filepath
+        self.old_paths = []
+        self.done = 0
+
+######################################################################
+# report on a finished job
+
+
+def finish_remap_job(job):
+    for newfile in job.missing_files:
+        print(f"Warning: Can't find {newfile}")
+
+    # something changed so rescan the list
+    if job.done != 0:
+        request_check()
+
+######################################################################
+# change the images for all the files in a plan which were found in one
+# go
+
+# returns (# of files changed, # not found)
+
+
+def apply_remap_plan(tree, plan):
+    job = RemapJob(tree, plan)
+    job.step(float("inf"))
+    finish_remap_job(job)
+    return job.done, job.missing
+
+######################################################################
+# move all the files in the folder at tree.nodes[index] (recursively) to the
+# same place under new_dir in one go, any which aren't there are left
+# unchanged
+
+# returns the number of files which couldn't be found
+
+
+def change_folder(tree, index, new_dir):
+    plan = plan_folder_change(tree, index, new_dir)
+    set_plan_found(plan, existing_files([f for k, f in plan.moves]))
+    return apply_remap_plan(tree, plan)[1]
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_ChangeFile(Operator):
+
+    """ Select a new file source for an Image """
+
+    bl_idname = "texture_locator.change_file"
+    bl_label = "Change file"
+
+    filepath: StringProperty()
+
+    @classmethod
+    def poll(cls, context):
+        return show_select_or_move(context)
+
+    @timed_execute("operator: Change file")
+    def execute(self, context):
+
+        # folder the user selected
+        newfile = self.properties.filepath
+
+        # check it exists
+        if not os.path.exists(newfile):
+            print(f"Warning: Can't find {newfile}")
+            self.report({'ERROR'}, f"{newfile} not found")
+        else:
+
+            # push an undo
+            bpy.ops.ed.undo_push()
+
+            s = context.window_manager.tl_stuff
+            node = _model["tree"].nodes[s.list_index]
+
+            # replace all the images
+            for img in pointer_images(node.pointers, image_lookup()):
+                replace_path(img, newfile)
+
+            # we need to rescan the list now
+            request_check()
+
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_LocateMissing(Operator):
+
+    """ Search the folders set in the preferences for missing files """
+
+    bl_idname = "texture_locator.locate_missing"
+    bl_label = "Locate Missing"
+
+    @classmethod
+    def poll(cls, context):
+        return (is_in_shader_node_editor(context)
+                and len(context.window_manager.tl_stuff.list_items) != 0
+                and _locate["future"] is None)
+
+    # all in one go (when run from a script)
+
+    @timed_execute("operator: Locate Missing")
+    def execute(self, context):
+        args = self.search_args(context)
+        if args is None:
+            return {'CANCELLED'}
+        return self.relink(*locate_missing(*args))
+
+    # from the button the folders are searched on a worker thread so
+    # Blender doesn't freeze while a big library is listed, Esc stops
+    # waiting for it (the search can't be stopped part way but its
+    # results are ignored)
+
+    def invoke(self, context, event):
+        args = self.search_args(context)
+        if args is None:
+            return {'CANCELLED'}
+        _locate["future"] = io_pool().submit(locate_missing, *args)
+        _locate["start"] = time.perf_counter()
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(LOCATE_INTERVAL,
+                                        window=context.window)
+        wm.modal_handler_add(self)
+        context.workspace.status_text_set(
+            "Locating missing files (Esc to cancel)")
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'INFO'}, "Locate Missing cancelled")
+            return {'CANCELLED'}
+
+        future = _locate["future"]
+        if event.type == 'TIMER' and future.done():
+            self.finish(context)
+            if _timing["enabled"]:
+                record_time("operator: Locate Missing",
+                            time.perf_counter() - _locate["start"])
+            return self.relink(*future.result())
+
+        # the rest of Blender carries on as normal while it's searching
+        return {'PASS_THROUGH'}
+
+    # Esc, or Blender cancelled it (e.g. a file was loaded)
+
+    def cancel(self, context):
+        future = _locate["future"]
+        if future is not None:
+            future.cancel()
+        self.finish(context)
+
+    def finish(self, context):
+        _locate["future"] = None
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+
+    # arguments for locate_missing(), None if there are no search folders
+
+    def search_args(self, context):
+        prefs = get_prefs(context)
+        roots = [bpy.path.abspath(r)
+                 for r in prefs.search_roots.split(os.pathsep) if r]
+        if not roots:
+            self.report({'ERROR'}, "No search folders set in preferences")
+            return None
+
+        # every file in the list, a packed file knows how big it should
+        # be
+        lookup = image_lookup()
+        files = []
+        for node in _model["tree"].files():
+            images = pointer_images(node.pointers, lookup)
+            if images:
+                packed = images[0].packed_file
+                files.append((node.pointers, node.filepath,
+                              packed.size if packed is not None else None))
+        return files, roots, prefs.match_size, file_index_path()
+
+    # change the images to the files which were found
+
+    def relink(self, missing, found):
+        if not missing:
+            self.report({'INFO'}, "No missing files")
+            return {'FINISHED'}
+
+        # push an undo
+        bpy.ops.ed.undo_push()
+
+        lookup = image_lookup()
+        for pointers, old_path, new_path in found:
+            for img in pointer_images(pointers, lookup):
+                replace_path(img, new_path)
+
+        if found:
+            request_check()
+
+        not_found = missing - len(found)
+        self.report({'WARNING'} if not_found else {'INFO'},
+                    f"Relinked {len(found)} of {missing} missing files")
+        return {'FINISHED'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_FindDuplicates(Operator):
+
+    """ Look for files in the list which have the same contents """
+
+    bl_idname = "texture_locator.find_duplicates"
+    bl_label = "Find Duplicates"
+
+    @classmethod
+    def poll(cls, context):
+        return (is_in_shader_node_editor(context)
+                and len(_model["tree"]) != 0
+                and _duplicates["future"] is None)
+
+    @timed_execute("operator: Find Duplicates")
+    def execute(self, context):
+        start_find_duplicates(_model["tree"])
+        return {'FINISHED'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_Consolidate(Operator):
+
+    """ Make the images using duplicate files all use the same file """
+
+    bl_idname = "texture_locator.consolidate"
+    bl_label = "Consolidate"
+
+    # one undo step for the whole lot
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return bool(_model["tree"].duplicate_groups)
+
+    @timed_execute("operator: Consolidate")
+    def execute(self, context):
+        changed = consolidate_duplicates(_model["tree"])
+        clear_duplicates()
+        self.report({'INFO'}, f"Changed {changed} files")
+        return {'FINISHED'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_ClearDuplicates(Operator):
+
+    """ Forget the duplicates """
+
+    bl_idname = "texture_locator.clear_duplicates"
+    bl_label = "Clear"
+
+    @classmethod
+    def poll(cls, context):
+        return (_duplicates["groups"] is not None
+                or _duplicates["future"] is not None)
+
+    def execute(self, context):
+        clear_duplicates()
+        return {'FINISHED'}
+
+######################################################################
+# Find Duplicates looks for files with the same contents, comparing
+# every byte of every file would take forever so files are grouped by
+# size first (most files have a unique size), then groups of the same
+# size are split by a hash of the start and end of each file and only
+# files which still match are hashed completely
+
+# hashing is done on a pool of threads in the background and the hashes
+# are cached so finding duplicates again only hashes files which have
+# changed (or weren't in the list before)
+
+# path -> (mtime, size, partial hash, full hash), hashes are None until
+# they're needed
+_hash_cache = {}
+
+_duplicates = {
+
+    # [(size, [normpath'd paths])] for each group of files with the
+    # same contents, None if Find Duplicates hasn't been run
+    "groups": None,
+
+    # background search and when it started
+    "future": None,
+    "start": 0.0
+}
+
+# bytes hashed from each end of a file for the partial hash, files of
+# up to twice this are completely covered by it
+PARTIAL_HASH_BYTES = 64 * 1024
+
+# bytes read at a time for the full hash
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# seconds between checks for the search being done
+DUPLICATES_INTERVAL = 0.2
+
+######################################################################
+# hash a file, either just the ends of it (partial) or all of it
+
+
+def hash_file(path, partial):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if partial:
+            h.update(f.read(PARTIAL_HASH_BYTES))
+            size = os.fstat(f.fileno()).st_size
+            if size > PARTIAL_HASH_BYTES:
+                f.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+                h.update(f.read(PARTIAL_HASH_BYTES))
+        else:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                h.update(chunk)
+    return h.digest()
+
+######################################################################
+# size of a file, 0 if it can't be read
+
+
+def file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+######################################################################
+# get the hash of a file from the cache or work it out, None if it
+# can't be read (runs on worker threads)
+
+
+def cached_hash(path, partial):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = _hash_cache.get(path)
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        cached = (stat.st_mtime_ns, stat.st_size, None, None)
+    slot = 2 if partial else 3
+    if cached[slot] is None:
+        try:
+            digest = hash_file(path, partial)
+        except OSError:
+            return None
+        cached = cached[:slot] + (digest,) + cached[slot + 1:]
+        _hash_cache[path] = cached
+    return cached[slot]
+
+######################################################################
+# split groups of [(size, [paths])] into smaller groups of files with
+# the same hash, files which don't match any others are dropped
+
+
+def split_groups(pool, groups, partial):
+    paths = [p for size, group in groups for p in group]
+    digests = dict(zip(paths, pool.map(
+        lambda p: cached_hash(p, partial), paths)))
+    result = []
+    for size, group in groups:
+        same = {}
+        for p in group:
+            if digests[p] is not None:
+                same.setdefault(digests[p], []).append(p)
+        result += [(size, g) for g in same.values() if len(g) > 1]
+    return result
+
+######################################################################
+# find groups of files with the same contents (runs on a worker thread)
+
+# returns [(size, [paths])] for each group, sorted by path
+
+
+def find_duplicates(paths):
+
+    # the same file could be in the list twice with different case
+    paths = list({os.path.normcase(p): p for p in paths}.values())
+
+    with ThreadPoolExecutor(max_workers=MAX_IO_THREADS) as pool:
+
+        # group by size, empty files don't count
+        sizes = {}
+        for path, size in zip(paths, pool.map(file_size, paths)):
+            if size:
+                sizes.setdefault(size, []).append(path)
+        groups = [(size, g) for size, g in sizes.items() if len(g) > 1]
+
+        # then by partial hash, then by full hash for files which are
+        # too big for the partial hash to cover
+        groups = split_groups(pool, groups, True)
+        small = [g for g in groups if g[0] <= 2 * PARTIAL_HASH_BYTES]
+        big = [g for g in groups if g[0] > 2 * PARTIAL_HASH_BYTES]
+        groups = small + split_groups(pool, big, False)
+
+    return sorted((size, sorted(g)) for size, g in groups)
+
+######################################################################
+# start looking for duplicates in the files in a tree
+
+
+def start_find_duplicates(tree):
+    paths = [os.path.normpath(node.filepath) for node in tree.files()]
+    _duplicates["future"] = io_pool().submit(find_duplicates, paths)
+    _duplicates["start"] = time.perf_counter()
+    bpy.app.timers.register(poll_find_duplicates,
+                            first_interval=DUPLICATES_INTERVAL)
+
+######################################################################
+# timer callback - pick up the duplicates when they've been found
+
+
+def poll_find_duplicates():
+    future = _duplicates["future"]
+    if future is None:
+        return None
+    if not future.done():
+        return DUPLICATES_INTERVAL
+    _duplicates["future"] = None
+    if _timing["enabled"]:
+        record_time("find duplicates",
+                    time.perf_counter() - _duplicates["start"])
+    _duplicates["groups"] = [] if future.cancelled() else future.result()
+    show_duplicates()
+    return None
+
+######################################################################
+# mark the duplicates in the current tree and the list
+
+
+def show_duplicates():
+    tree = _model["tree"]
+    tree.set_duplicates(_duplicates["groups"] or ())
+    items = bpy.context.window_manager.tl_stuff.list_items
+    if len(items) == len(tree):
+        for item, node in zip(items, tree.nodes):
+            if item.duplicate != node.duplicate:
+                item.duplicate = node.duplicate
+    redraw_node_editors()
+
+######################################################################
+# forget the duplicates (and stop looking for them)
+
+
+def clear_duplicates():
+    future = _duplicates["future"]
+    _duplicates["future"] = None
+    _duplicates["groups"] = None
+    if future is not None:
+        future.cancel()
+    if bpy.app.timers.is_registered(poll_find_duplicates):
+        bpy.app.timers.unregister(poll_find_duplicates)
+    show_duplicates()
+
+######################################################################
+# change the images which use each group of duplicates to use the first
+# file in the group
+
+# returns the number of files which were changed
+
+
+def consolidate_duplicates(tree):
+    lookup = image_lookup()
+    changed = 0
+    for size, group in tree.duplicate_groups:
+        keep = tree.nodes[group[0]].filepath
+        for i in group[1:]:
+            for img in pointer_images(tree.nodes[i].pointers, lookup):
+                replace_path(img, keep)
+            changed += 1
+
+    # something changed so rescan the list
+    if changed != 0:
+        request_check()
+    return changed
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_Select(Operator):
+
+    """ Select the shader nodes which are using the selected texture(s) """
+
+    bl_idname = "texture_locator.select"
+    bl_label = "Select"
+
+    @classmethod
+    def poll(cls, context):
+        return show_select_or_move(context)
+
+    # map image pointer -> Image Texture nodes which use it, one pass
+    # over the nodes for the whole selection
+    def image_nodes(self, context):
+        nodes = {}
+        skip = {"GENERATED", "VIEWER"}
+        for n in context.space_data.node_tree.nodes:
+            if (n.bl_idname == "ShaderNodeTexImage"
+                    and n.image is not None
+                    and n.image.source not in skip):
+                nodes.setdefault(n.image.as_pointer(), []).append(n)
+        return nodes
+
+    # select the Shader Nodes which reference a file
+    def select(self, nodes, node):
+        for ptr in node.pointers:
+            for n in nodes.get(ptr, ()):
+                n.select = True
+
+    @timed_execute("operator: Select")
+    def execute(self, context):
+        s = context.window_manager.tl_stuff
+        tree = _model["tree"]
+        node = tree.nodes[s.list_index]
+
+        # first deselect everything
+        bpy.ops.node.select_all(action='DESELECT')
+
+        nodes = self.image_nodes(context)
+
+        # if it's just an image, select the nodes
+        if not node.is_folder:
+            self.select(nodes, node)
+        else:
+            # else do selection for all children
+            for child in tree.files(node.index):
+                self.select(nodes, child)
+
+        # make sure the selected nodes are visible
+        bpy.ops.node.view_selected()
+
+        return {'FINISHED'}
+
+######################################################################
+
+
+# icons for files in the UIList based on their status
+STATUS_ICONS = {
+    'UNKNOWN': "IMAGE_DATA",
+    'PRESENT': "IMAGE_DATA",
+    'MISSING': "ERROR",
+    'MODIFIED': "FILE_REFRESH"
+}
+
+
+class TEXTURE_LOCATOR_UL_List(UIList):
+
+    """ UIList of folders and texture files - ghetto treeview mode """
+
+    # filter based on tree nodes rather than... the filter
+
+    def filter_items(self, context, data, propname):
+
+        items = getattr(data, propname)
+
+        # apparently you:
+        #     set bitflag_filter_item to SHOW it
+        #     clear bitflag_filter_item to HIDE it
+
+        # children of nodes which are not expanded are hidden, the
+        # flags are kept in the tree and only rebuilt if it's changed
+
+        tree = _model["tree"]
+        if len(tree) != len(items):
+            return [self.bitflag_filter_item] * len(items), []
+
+        with timed("filter_items"):
+            flags = tree.visibility(self.bitflag_filter_item,
+                                    self.filter_name, self.filter_missing,
+                                    self.filter_duplicates)
+            order = tree.size_order() if self.sort_by_size else tree.order
+
+        return flags, order
+
+    # only show missing files (and their folders)
+    filter_missing: BoolProperty(
+        name="Missing Only",
+        description="Only show files which are missing")
+
+    # only show duplicate files (and their folders)
+    filter_duplicates: BoolProperty(
+        name="Duplicates Only",
+        description="Only show files which are duplicates of other files "
+                    "(after Find Duplicates)")
+
+    # put the biggest files/folders (by memory) first in each folder
+    sort_by_size: BoolProperty(
+        name="Sort by Memory",
+        description="Sort the files and folders in each folder by their "
+                    "estimated memory, biggest first")
+
+    # name filter (see SearchIndex), missing and duplicate files and
+    # sorting by memory - no inverting or sorting by name as the order
+    # has to stay a tree
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, "filter_name", text="")
+        row.prop(self, "filter_missing", text="", icon="ERROR")
+        row.prop(self, "filter_duplicates", text="", icon="DUPLICATE")
+        row.prop(self, "sort_by_size", text="", icon="SORTSIZE")
+
+    # draw one
+
+    def draw_item(self, context, layout, data, item,
+                  icon, active_data, active_propname, index, flt_flag):
+
+        # add up the time for all the rows when timing
+        if not _timing["enabled"]:
+            draw_row(layout, item)
+        else:
+            start = time.perf_counter()
+            draw_row(layout, item)
+            _timing["draw_item"] += time.perf_counter() - start
+
+######################################################################
+# draw one row of the UIList
+
+
+def draw_row(layout, item):
+
+    row = layout.row(align=True)
+
+    # indent with dummy props
+
+    for _ in range(item.depth):
+        row.prop(item, "expanded", icon="NONE", text="", emboss=False)
+
+    # work out icons for folders
+    if item.is_folder:
+        icon1 = 'TRIA_DOWN' if item.expanded else 'TRIA_RIGHT'
+        icon2 = "COLLECTION_COLOR_05"
+    else:
+        # icons for files show if they're missing/modified
+        icon1 = "NONE"
+        icon2 = STATUS_ICONS[item.status]
+
+    # icon1 toggles expansion which only matters for folders
+    # but still use a prop so alignment is maintained
+
+    row.prop(item, "expanded", text="", emboss=False, icon=icon1)
+
+    # icon2 + text
+
+    # duplicate files show which group they're in
+    if item.duplicate:
+        row.label(text=f"{item.label}  [{item.duplicate}]", icon=icon2)
+    else:
+        row.label(text=item.label, icon=icon2)
+
+    # then estimated memory (once it's known)
+    if item.memory:
+        sub = row.row()
+        sub.alignment = 'RIGHT'
+        sub.label(text=format_size(item.memory))
+
+######################################################################
+# walking the nodes is slow and the list is checked for changes a few
+# times a second, so what's in each node tree is remembered until the
+# depsgraph says the tree has changed (see on_depsgraph_update)
+
+# node tree as_pointer() -> ([image as_pointer()], [node group
+# as_pointer()]) for the nodes in it
+_tree_contents = {}
+
+######################################################################
+# images and node groups used by the nodes in a node tree
+
+
+def node_tree_contents(node_tree):
+    ptr = node_tree.as_pointer()
+    contents = _tree_contents.get(ptr)
+    if contents is None:
+        images = []
+        groups = []
+        for n in node_tree.nodes:
+            img = getattr(n, "image", None)
+            if img is not None:
+                images.append(img.as_pointer())
+            group = getattr(n, "node_tree", None)
+            if group is not None:
+                groups.append(group.as_pointer())
+        _tree_contents[ptr] = contents = (images, groups)
+    return contents
+
+######################################################################
+# forget what's in some node trees, or all of them if ptrs is None
+
+
+def forget_tree_contents(ptrs=None):
+    if ptrs is None:
+        _tree_contents.clear()
+    else:
+        for ptr in ptrs:
+            _tree_contents.pop(ptr, None)
+
+######################################################################
+# get all the images (including duplicates) referenced by the nodes in
+# some node trees, recursing into node groups if required
+
+# each node tree is only visited once however many times it's used
+
+
+def node_tree_images(node_trees, recursive):
+    pointers = []
+    visited = set()
+    groups = None
+    stack = [t for t in node_trees if t]
+    while stack:
+        node_tree = stack.pop()
+        ptr = node_tree.as_pointer()
+        if ptr in visited:
+            continue
+        visited.add(ptr)
+        images, group_ptrs = node_tree_contents(node_tree)
+        pointers.extend(images)
+        if recursive and group_ptrs:
+            if groups is None:
+                groups = {g.as_pointer(): g for g in bpy.data.node_groups}
+            stack.extend(groups[g] for g in group_ptrs if g in groups)
+    return pointer_images(pointers, image_lookup())
+
+######################################################################
+# get the images for a scope (see MyStuff.scope), node_tree is the one
+# being edited
+
+
+def scope_images(scope, node_tree):
+    if scope == 'IMAGES':
+        return list(bpy.data.images)
+    if scope == 'MATERIALS':
+        return node_tree_images((m.node_tree for m in bpy.data.materials),
+                                True)
+    return node_tree_images([node_tree], scope == 'RECURSIVE')
+
+######################################################################
+# scan for unique images / paths
+
+
+def do_scan(s, images):
+    with timed("scan: group images"):
+        paths = group_images(images)
+    with timed("scan: build tree"):
+        tree = TextureTree.from_paths(paths)
+    with timed("scan: build search index"):
+        tree.index_labels()
+    tree.set_duplicates(_duplicates["groups"] or ())
+    with timed("scan: update list"):
+        update_list(s, tree, grouped_lookup(paths))
+    with timed("scan: start status check"):
+        start_status_check(tree)
+
+######################################################################
+# group images by source file
+
+# returns {folder -> {filename -> [images which reference the file]}}
+
+# paths are normalized so 'a/../b' and 'b' (and on Windows 'B' and 'b')
+# are one folder, every node in the tree gets a unique key and a file
+# only appears once (the first spelling seen is the one shown)
+
+
+def group_images(images):
+
+    paths = {}
+
+    # images already recorded, lots of nodes can share the same image
+    seen = set()
+
+    # folder_key() -> folder, (folder_key(), normcase'd name) -> name
+    folders = {}
+    names = {}
+
+    for img in images:
+
+        # if it's an Image which is based on a source file
+        if img.filepath:
+
+            # an image only has one source file so if it's been
+            # seen already there's nothing more to do
+            ptr = img.as_pointer()
+            if ptr in seen:
+                continue
+            seen.add(ptr)
+
+            # get path and filename
+            path, name = os.path.split(
+                os.path.normpath(bpy.path.abspath(img.filepath)))
+            if path and name:
+                key = folder_key(path)
+                path = folders.setdefault(key, path)
+                name = names.setdefault((key, os.path.normcase(name)), name)
+
+                # add new path/file if haven't seen it yet
+                files = paths.setdefault(path, {})
+                files.setdefault(name, []).append(img)
+
+    return paths
+
+######################################################################
+# as_pointer() -> image for the images from group_images()
+
+
+def grouped_lookup(paths):
+    return {img.as_pointer(): img
+            for files in paths.values()
+            for images in files.values()
+            for img in images}
+
+######################################################################
+# ListItem fields which come straight from a TreeNode
+
+NODE_FIELDS = ("is_folder", "path", "label", "index", "depth", "duplicate",
+               "memory")
+
+######################################################################
+# set the fields of a ListItem which differ between two nodes (old can
+# be None for a new item), lookup is as_pointer() -> image
+
+
+def update_item(item, old, node, lookup):
+    for field in NODE_FIELDS:
+        value = getattr(node, field)
+        if old is None or getattr(old, field) != value:
+            setattr(item, field, value)
+
+    # compare pointers rather than holding on to the old images
+    if old is None or old.pointers != node.pointers:
+        item.images.clear()
+        for i in pointer_images(node.pointers, lookup):
+            img_ptr = item.images.add()
+            img_ptr.img = i
+
+######################################################################
+# make a new tree the current one and make the UIList items match it
 
+# nodes which are still there are updated in place (so expanded state is
+# kept), nodes which have gone are removed and new ones are inserted -
+# both trees are in the same order so this is one pass over each (keys
+# are unique, see group_images)
 
-class MyStuff(PropertyGroup):
+# a restored tree (see restore_scan) brings its own expanded state
 
-    # the items in the UIList
-    list_items: CollectionProperty(type=ListItem)
 
-    # the index of the selected item in the UIList
-    list_index: IntProperty(default=-1, name=" ")
+def update_list(s, tree, lookup, restore=False):
 
-    # the last scanned material name - if current material name
-    # is different from this, then rescan
-    material_name: StringProperty()
+    items = s.list_items
+    old_tree = _model["tree"]
+    old_nodes = old_tree.nodes
 
-    # node source(s) changed so refresh the UIList next time it's drawn
-    refresh_required: BoolProperty()
+    # items don't match the last tree (new file loaded or whatever)
+    # so have to start from scratch
+    if len(items) != len(old_nodes):
+        items.clear()
+        old_nodes = []
 
-######################################################################
-# split a layout into columns based on list of ratios
+    # try to keep the selection on the thing it was on before...
+    index = s.list_index
+    old_key = None
+    if 0 <= index < len(old_nodes):
+        old_key = old_nodes[index].key
+
+    # remove the items which have gone, backwards so indices stay valid
+    kept = []
+    for i in range(len(old_nodes) - 1, -1, -1):
+        if old_nodes[i].key in tree.by_key:
+            kept.append(old_nodes[i])
+        else:
+            items.remove(i)
+    kept.reverse()
+
+    # from here on the items are for the new tree
+    _model["tree"] = tree
+
+    # items[:n] match nodes[:n] and items[n:] are the kept nodes which
+    # haven't been matched yet
+    k = 0
+    for n, node in enumerate(tree.nodes):
+        if k < len(kept) and kept[k].key == node.key:
+            item = items[n]
+            update_item(item, kept[k], node, lookup)
+            if not restore:
+                tree.expanded[n] = old_tree.expanded[kept[k].index]
+            elif item.expanded != tree.expanded[n]:
+                item.expanded = tree.expanded[n]
+            k += 1
+        else:
+            item = items.add()
+            update_item(item, None, node, lookup)
+            item.expanded = tree.expanded[n]
+            items.move(len(items) - 1, n)
 
+    # anything left over is out of order, just get rid of it
+    for i in range(len(items) - 1, len(tree) - 1, -1):
+        items.remove(i)
 
-def split_layout(layout, ratios, **kwargs):
-    columns = []
-    for i in range(len(ratios)):
-        layout = layout.split(factor=ratios[i] / sum(ratios[i:]))
-        columns.append(layout.column(**kwargs))
-    return columns
+    # selection index hopefully pointing at same old one, or the
+    # folder it was in, or none
+    new_index = -1
+    if old_key is not None:
+        new_index = tree.find(old_key)
+        if new_index == -1:
+            new_index = tree.find((old_key[0], ""))
+    s.list_index = new_index
 
 ######################################################################
-# check if node at index i is a child of node at index p
+# after a scan the files are stat'ed on a pool of threads (slow network
+# drives shouldn't hold up the UI) and a timer copies the results into
+# the list as they arrive
 
+# normpath'd file path -> FileStatus, cleared on each scan
+_file_status = {}
 
-def is_child(items, i, p):
-    i = items[i].parent
-    while(i != -1):
-        if i == p:
-            return True
-        i = items[i].parent
-    return False
+# normpath'd file path -> mtime when the file was first seen, used to
+# spot files which have been modified (Blender doesn't say when an image
+# was loaded so this is the closest thing), cleared when a file is loaded
+_first_mtimes = {}
 
+_status_check = {
 
-######################################################################
-# helper for poll() functions
+    # futures for batches of results which haven't been applied yet,
+    # replaced on each scan so results from an old scan are never
+    # applied (even if they were already running and couldn't be
+    # cancelled)
+    "pending": []
+}
 
+# files to stat per batch
+STATUS_BATCH_SIZE = 64
 
-def is_in_shader_node_editor(context):
-    return (context.space_data
-            and context.space_data.type == "NODE_EDITOR"
-            and context.space_data.tree_type == "ShaderNodeTree")
+# seconds between checks for status results
+STATUS_INTERVAL = 0.1
 
+# thread pool for background file system work, created when needed
+_io_pool = None
+
+# how it looks on disk, size and mtime are 0 for missing files and info
+# is the ImageInfo from the file header, None if it can't be read
+FileStatus = namedtuple("FileStatus", "status size mtime info")
 
 ######################################################################
-# only show select/move buttons if a valid item is selected
+# get the thread pool for background file system work
 
 
-def show_select_or_move(context):
-    s = context.window_manager.tl_stuff
-    index = s.list_index
-    items = s.list_items
-    return (is_in_shader_node_editor(context)
-            and 0 <= index < len(items))
+def io_pool():
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=MAX_IO_THREADS)
+    return _io_pool
 
 ######################################################################
-# get full filepath for an image list_item (prepend parent path)
+# stat a file and read its header (runs on a worker thread)
 
 
-def image_path(items, index):
-    path = items[index].path
-    p = items[index].parent
-    return None if p == -1 else os.path.join(items[p].path, path)
+def check_file_status(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return FileStatus('MISSING', 0, 0, None)
+    first = _first_mtimes.setdefault(path, stat.st_mtime_ns)
+    status = 'PRESENT' if first == stat.st_mtime_ns else 'MODIFIED'
+    return FileStatus(status, stat.st_size, stat.st_mtime_ns,
+                      read_image_info(path, stat))
 
 ######################################################################
-# change image filepath, maintaining relativity if possible
-
+# stat a batch of files (runs on a worker thread)
 
-def replace_path(image, new_path):
-    if image.filepath[:2] == '//':
-        try:
-            new_path = bpy.path.relpath(new_path)
-        except ValueError:
-            pass
-    image.filepath = new_path
 
+def check_batch_status(paths):
+    return [(path, check_file_status(path)) for path in paths]
 
 ######################################################################
+# forget the old statuses and start checking the files in a tree
 
 
-class TEXTURE_LOCATOR_OT_ChangeFolder(Operator):
+def start_status_check(tree):
+    _file_status.clear()
+    for f in _status_check["pending"]:
+        f.cancel()
 
-    """ Select a new folder for all children of a path """
+    paths = [os.path.normpath(node.filepath) for node in tree.files()]
+    pool = io_pool()
+    _status_check["pending"] = [
+        pool.submit(check_batch_status, paths[i:i + STATUS_BATCH_SIZE])
+        for i in range(0, len(paths), STATUS_BATCH_SIZE)]
 
-    bl_idname = "texture_locator.change_folder"
-    bl_label = "Change folder"
+    if paths and not bpy.app.timers.is_registered(apply_status_results):
+        bpy.app.timers.register(apply_status_results,
+                                first_interval=STATUS_INTERVAL)
 
-    directory: StringProperty()
+    # and keep watching them if that's turned on
+    start_file_watch()
 
-    @classmethod
-    def poll(cls, context):
-        return show_select_or_move(context)
+######################################################################
+# timer callback - copy finished status results into the list
 
-    def execute(self, context):
 
-        # folder the user selected
-        new_dir = self.properties.directory
+def apply_status_results():
+    pending = _status_check["pending"]
+    done = [f for f in pending if f.done()]
+    if not done:
+        return STATUS_INTERVAL if pending else None
+    _status_check["pending"] = [f for f in pending if f not in done]
 
-        s = context.window_manager.tl_stuff
-        index = s.list_index
-        items = s.list_items
+    items = bpy.context.window_manager.tl_stuff.list_items
+    tree = _model["tree"]
+    if len(items) != len(tree):
+        return STATUS_INTERVAL if _status_check["pending"] else None
 
-        # this is the folder they want to change
-        item = items[index]
+    for f in done:
+        if f.cancelled():
+            continue
+        for path, status in f.result():
+            set_file_status(tree, items, path, status)
+    update_list_memory(tree, items)
 
-        # push an undo (TODO(chs) work out why you have to undo twice!?)
-        bpy.ops.ed.undo_push()
+    redraw_node_editors()
+    return STATUS_INTERVAL if _status_check["pending"] else None
+
+######################################################################
+# record the status of a file and show it in the list (items must match
+# the tree)
 
-        # track # of failed moves
-        missing = 0
 
-        # children will be below this item
-        for n in range(index + 1, len(items)):
+def set_file_status(tree, items, path, status):
+    _file_status[path] = status
+    index = tree.find_file(path)
+    if index == -1:
+        return
+    tree.set_missing(index, status.status == 'MISSING')
+    tree.set_memory(index, image_memory(status.info))
+    if items[index].status != status.status:
+        items[index].status = status.status
 
-            # finished yet?
-            if not is_child(items, n, index):
-                break
+######################################################################
+# update the memory shown in the list after some set_file_status() calls
 
-            # only move images
-            if not items[n].is_folder:
 
-                # get image filepath
-                local = image_path(items, n)
-                if local:
+def update_list_memory(tree, items):
+    with timed("memory totals"):
+        for i in tree.update_memory():
+            items[i].memory = tree.nodes[i].memory
 
-                    # get relative path from old place
-                    relative = os.path.relpath(local, item.path)
+######################################################################
+# when it's turned on in the preferences the files in the list are
+# watched so images can be reloaded when their files are overwritten
 
-                    # tack it onto the new place
-                    newfile = os.path.join(new_dir, relative)
+# a timer stat's a batch of files on the thread pool each time it runs
+# (working through the whole list, then starting again) and compares
+# the mtime and size with what they were last time - only images whose
+# files have changed are reloaded
 
-                    # move all the images if the file exists
-                    if os.path.exists(newfile):
-                        for img in items[n].images:
-                            replace_path(img.img, newfile)
+_file_watch = {
 
-                        # something changed so rescan the list next time
-                        s.refresh_required = True
-                    else:
-                        print(f"Warning: Can't find {newfile}")
-                        missing += 1
-        if missing != 0:
-            self.report({'WARNING'}, f"{missing} files not found")
-        return {'FINISHED'}
+    # the tree being watched and its normpath'd file paths
+    "tree": None,
+    "paths": [],
 
-    def invoke(self, context, event):
-        context.window_manager.fileselect_add(self)
-        return {'RUNNING_MODAL'}
+    # where the next batch starts in paths
+    "next": 0,
 
-######################################################################
+    # future for the batch being checked
+    "pending": None,
 
+    # normpath'd path -> (mtime, size) when it was last checked
+    "known": {}
+}
 
-class TEXTURE_LOCATOR_OT_ChangeFile(Operator):
+# seconds between batches
+WATCH_INTERVAL = 0.5
 
-    """ Select a new file source for an Image """
+######################################################################
+# start the watcher (if it's turned on)
 
-    bl_idname = "texture_locator.change_file"
-    bl_label = "Change file"
 
-    filepath: StringProperty()
+def start_file_watch():
+    if (get_prefs(bpy.context).watch_files
+            and not bpy.app.timers.is_registered(poll_file_watch)):
+        bpy.app.timers.register(poll_file_watch,
+                                first_interval=WATCH_INTERVAL)
 
-    @classmethod
-    def poll(cls, context):
-        return show_select_or_move(context)
+######################################################################
+# forget everything the watcher knows
 
-    def execute(self, context):
 
-        # folder the user selected
-        newfile = self.properties.filepath
+def reset_file_watch():
+    future = _file_watch["pending"]
+    if future is not None:
+        future.cancel()
+    _file_watch.update(tree=None, paths=[], next=0, pending=None)
+    _file_watch["known"].clear()
 
-        # check it exists
-        if not os.path.exists(newfile):
-            print(f"Warning: Can't find {newfile}")
-            self.report({'ERROR'}, f"{newfile} not found")
-        else:
+######################################################################
+# timer callback - pick up the last batch and start the next one
+
+
+def poll_file_watch():
+    prefs = get_prefs(bpy.context)
+    if not prefs.watch_files:
+        reset_file_watch()
+        return None
+
+    # new scan, the known mtimes are kept for files still in it and
+    # forgotten for the rest
+    tree = _model["tree"]
+    if _file_watch["tree"] is not tree:
+        paths = [os.path.normpath(node.filepath) for node in tree.files()]
+        known = _file_watch["known"]
+        _file_watch.update(tree=tree, paths=paths, next=0, known={
+            p: known[p] for p in paths if p in known})
+
+    future = _file_watch["pending"]
+    if future is not None:
+        if not future.done():
+            return WATCH_INTERVAL
+        _file_watch["pending"] = None
+        if not future.cancelled():
+            with timed("file watch"):
+                apply_watch_results(tree, future.result())
+
+    paths = _file_watch["paths"]
+    if paths:
+        first = _file_watch["next"] % len(paths)
+        batch = paths[first:first + prefs.watch_batch_size]
+        _file_watch["next"] = first + len(batch)
+        _file_watch["pending"] = io_pool().submit(check_batch_status,
+                                                  batch)
+    return WATCH_INTERVAL
 
-            # push an undo
-            bpy.ops.ed.undo_push()
+######################################################################
+# reload the images for files which have changed since they were last
+# checked and update the status of all of them
 
-            s = context.window_manager.tl_stuff
-            index = s.list_index
-            items = s.list_items
-            item = items[index]
 
-            # replace all the images
-            for img in item.images:
-                replace_path(img.img, newfile)
+def apply_watch_results(tree, results):
+    items = bpy.context.window_manager.tl_stuff.list_items
+    if len(items) != len(tree):
+        return
 
-            # we need to rescan the list now
-            s.refresh_required = True
+    known = _file_watch["known"]
+    lookup = None
+    for path, status in results:
+        last = known.get(path)
+        known[path] = (status.mtime, status.size)
+        if (last is not None and last != known[path]
+                and status.status != 'MISSING'):
+            if lookup is None:
+                lookup = image_lookup()
+            reload_file(tree, path, lookup)
 
-        return {'FINISHED'}
+            # the images match the file again
+            _first_mtimes[path] = status.mtime
+            status = status._replace(status='PRESENT')
 
-    def invoke(self, context, event):
-        context.window_manager.fileselect_add(self)
-        return {'RUNNING_MODAL'}
+        set_file_status(tree, items, path, status)
+    update_list_memory(tree, items)
+
+    if lookup is not None:
+        redraw_node_editors()
 
 ######################################################################
+# reload the images which use a file and its preview
 
 
-class TEXTURE_LOCATOR_OT_Select(Operator):
+def reload_file(tree, path, lookup):
+    index = tree.find_file(path)
+    if index == -1:
+        return
+    for img in pointer_images(tree.nodes[index].pointers, lookup):
+        if img.packed_file is None:
+            img.reload()
+    forget_preview(path)
 
-    """ Select the shader nodes which are using the selected texture(s) """
+######################################################################
+# status of a file from the last check (None if not checked yet)
 
-    bl_idname = "texture_locator.select"
-    bl_label = "Select"
 
-    @classmethod
-    def poll(cls, context):
-        return show_select_or_move(context)
+def file_status(path):
+    return _file_status.get(os.path.normpath(path))
 
-    # select the Shader Nodes which reference an image
-    def select(self, context, item):
-        for img in item.images:
-            nodes = context.space_data.node_tree.nodes
-            valid = ["GENERATED", "VIEWER"]
-            for n in nodes:
-                should_select = (n.bl_idname == "ShaderNodeTexImage"
-                                 and n.image is not None
-                                 and not n.image.source in valid
-                                 and n.image.name == img.img.name)
-                n.select |= should_select
+######################################################################
+# redraw all the node editors (after something changed in a timer)
 
-    def execute(self, context):
-        s = context.window_manager.tl_stuff
-        index = s.list_index
-        items = s.list_items
-        item = items[index]
 
-        # first deselect everything
-        bpy.ops.node.select_all(action='DESELECT')
+def redraw_node_editors():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'NODE_EDITOR':
+                area.tag_redraw()
 
-        # if it's just an image, select the nodes
-        if not item.is_folder:
-            self.select(context, item)
-        else:
-            # else do selection for all children
-            for n in range(index + 1, len(items)):
-                if not is_child(items, n, index):
-                    break
-                self.select(context, items[n])
+######################################################################
+# human readable file size
 
-        # make sure the selected nodes are visible
-        bpy.ops.node.view_selected()
 
-        return {'FINISHED'}
+def format_size(size):
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
 
 ######################################################################
+# the list is rescanned when the images in scope (e.g. the ones
+# referenced by the node tree the panel is showing) change
 
+# depsgraph updates (which include adding/removing nodes) and the panel
+# showing a different node tree just set a flag and start a timer, then
+# the timer compares a fingerprint of the image references with the one
+# from the last scan - so there's no scanning in draw() and lots of
+# updates in a row only cause one check
 
-class TEXTURE_LOCATOR_UL_List(UIList):
+_watch = {
 
-    """ UIList of folders and texture files - ghetto treeview mode """
+    # as_pointer() of the node tree the panel last drew
+    "tree": 0,
 
-    # filter based on tree nodes rather than... the filter
+    # fingerprint of the last scan
+    "fingerprint": None,
 
-    def filter_items(self, context, data, propname):
+    # something might have changed, check the fingerprint
+    "dirty": False
+}
 
-        items = getattr(data, propname)
+# seconds to wait after a change before checking the fingerprint
+CHECK_INTERVAL = 0.25
 
-        # order never changes
+######################################################################
+# cheap summary of the images in scope, if this changes then the list
+# needs rescanning
 
-        order = [n for n in range(0, len(items))]
+# the node tree being edited only matters for the node tree scopes so
+# switching material doesn't cause a rescan for the wider scopes
 
-        # apparently you:
-        #     set bitflag_filter_item to SHOW it
-        #     clear bitflag_filter_item to HIDE it
 
-        # hide children of nodes which are not expanded
+def scan_fingerprint(scope, node_tree, images):
+    tree = 0
+    if scope in ('TREE', 'RECURSIVE') and node_tree:
+        tree = node_tree.as_pointer()
+    refs = tuple((img.as_pointer(), img.filepath) for img in images)
+    return (scope, tree, refs)
 
-        flags = [0] * len(items)
+######################################################################
+# scan the images in scope (unless they've already been got) and
+# remember the fingerprint
 
-        index = 0
-        for i in items:
 
-            show = self.bitflag_filter_item
-            p = i.parent
-            while p != -1:
-                if not items[p].expanded:
-                    show = 0
-                    break
-                p = items[p].parent
+def scan_tree(s, node_tree, images=None):
+    if images is None:
+        with timed("scan: collect images"):
+            images = scope_images(s.scope, node_tree)
+    do_scan(s, images)
+    _watch["fingerprint"] = scan_fingerprint(s.scope, node_tree, images)
+    cache_scan(_watch["fingerprint"], _model["tree"])
 
-            flags[index] = show
-            index += 1
+######################################################################
+# the trees from recent scans are kept in an LRU cache keyed by their
+# fingerprint, so going back to a material (or scope) which was shown
+# recently just puts its tree back, expanded state and all
 
-        return flags, order
+# the current tree is in here too and it's the same object, so changes
+# to its expanded state are kept without doing anything
 
-    # hide the filter UI
+# fingerprint -> (TextureTree, estimated bytes), oldest first
+_scan_cache = OrderedDict()
 
-    def draw_filter(self, context, layout):
-        pass
+# rough size of a TreeNode and its list entries, the strings and
+# pointers it refers to are added on top
+TREE_NODE_BYTES = 200
 
-    # draw one
+######################################################################
+# estimate memory used by a cached scan (the fingerprint is big too)
 
-    def draw_item(self, context, layout, data, item,
-                  icon, active_data, active_propname, index, flt_flag):
 
-        s = context.window_manager.tl_stuff
-        items = s.list_items
+def scan_bytes(fingerprint, tree):
+    size = sum(TREE_NODE_BYTES
+               + sys.getsizeof(node.path)
+               + sys.getsizeof(node.label)
+               + sys.getsizeof(node.filepath)
+               + sys.getsizeof(node.pointers)
+               for node in tree.nodes)
+    refs = fingerprint[2]
+    return size + sys.getsizeof(refs) + sum(
+        sys.getsizeof(ref) + sys.getsizeof(ref[1]) for ref in refs)
 
-        row = layout.row(align=True)
+######################################################################
+# release least recently used scans until within limits (but always
+# keep the most recent one)
 
-        # indent with dummy props
 
-        p = item.parent
-        while p != -1:
-            row.prop(item, "expanded", icon="NONE", text="", emboss=False)
-            p = items[p].parent
+def trim_scan_cache(max_count, max_bytes):
+    total = sum(size for tree, size in _scan_cache.values())
+    while len(_scan_cache) > 1 and (len(_scan_cache) > max_count
+                                    or total > max_bytes):
+        fingerprint, (tree, size) = _scan_cache.popitem(last=False)
+        total -= size
 
-        # root folders show whole path, children show relative paths
-        rel = item.path
+######################################################################
+# remember the tree from a scan
 
-        # work out icons for folders
-        if item.is_folder:
-            icon1 = 'TRIA_DOWN' if item.expanded else 'TRIA_RIGHT'
-            icon2 = "COLLECTION_COLOR_05"
 
-            # also make paths relative for children
-            if item.parent != -1:
-                rel = os.path.relpath(item.path, items[item.parent].path)
-        else:
-            # basic icons for files
-            icon1 = "NONE"
-            icon2 = "IMAGE_DATA"
+def cache_scan(fingerprint, tree):
+    _scan_cache[fingerprint] = (tree, scan_bytes(fingerprint, tree))
+    _scan_cache.move_to_end(fingerprint)
 
-        # icon1 toggles expansion which only matters for folders
-        # but still use a prop so alignment is maintained
+    prefs = get_prefs(bpy.context)
+    trim_scan_cache(prefs.scan_cache_count,
+                    prefs.scan_cache_mb * 1024 * 1024)
 
-        row.prop(item, "expanded", text="", emboss=False, icon=icon1)
+######################################################################
+# put back the tree from an earlier scan with the same fingerprint, the
+# images are the ones in scope now (the fingerprint says they're the
+# same ones)
 
-        # icon2 + text
+# returns False if there isn't one
 
-        row.label(text=rel, icon=icon2)
 
-######################################################################
-# scan for unique images / paths
+def restore_scan(s, fingerprint, images):
+    entry = _scan_cache.get(fingerprint)
+    if entry is None:
+        return False
+    _scan_cache.move_to_end(fingerprint)
 
+    tree = entry[0]
+    with timed("scan: restore"):
+        lookup = {img.as_pointer(): img for img in images}
+        tree.set_duplicates(_duplicates["groups"] or ())
+        update_list(s, tree, lookup, restore=True)
 
-def do_scan(context):
+        # files could have changed while it wasn't being shown
+        start_status_check(tree)
+    _watch["fingerprint"] = fingerprint
+    return True
 
-    s = context.window_manager.tl_stuff
+######################################################################
+# find the node editor area showing the node tree with a given pointer
 
-    paths = {}
 
-    # this check _should_ be unnecessary but...
-    if context.space_data and context.space_data.node_tree:
+def find_node_tree(pointer):
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type != 'NODE_EDITOR':
+                continue
+            space = area.spaces.active
+            tree = space.node_tree
+            if (space.tree_type == "ShaderNodeTree"
+                    and tree and tree.as_pointer() == pointer):
+                return area, tree
+    return None, None
 
-        # scan all the nodes
-        for n in context.space_data.node_tree.nodes:
+######################################################################
+# timer callback - rescan if the watched node tree has changed
 
-            # if node has an Image which is based on a source file
-            img = getattr(n, "image", None)
 
-            if img is not None and img.filepath:
-
-                # get path and filename
-                path, name = os.path.split(bpy.path.abspath(img.filepath))
-                if path and name:
-
-                    # add new path if haven't seen it yet
-                    if path not in paths:
-                        paths[path] = []
-
-                    # and any new image(s) which reference the file
-                    exists = False
-                    for e in paths[path]:
-                        if e['filename'] == name:
-                            if not img in e['images']:
-                                e['images'].append(img)
-                            exists = True
-                            break
-                    if not exists:
-                        paths[path].append({
-                            "filename": name,
-                            "images": [img]})
-
-    # sorted list of paths so parents come before children
-    sorted_paths = sorted(paths.keys())
-
-    # now make the List Items
-    items = s.list_items
+def check_for_changes():
+    if not _watch["dirty"]:
+        return None
 
-    # try to keep the selection on the thing it was on before...
-    index = s.list_index
+    # wait until a folder change has finished, the images are half done
+    if _remap["job"] is not None:
+        return CHECK_INTERVAL
+    _watch["dirty"] = False
 
-    old_path = ""
-    old_parent = ""
-    if index != -1:
-        item = items[index]
-        old_path = item.path
-        if not item.is_folder:
-            old_parent = items[item.parent].path
+    area, node_tree = find_node_tree(_watch["tree"])
+    if node_tree is None:
+        return None
 
-    new_index = -1
+    s = bpy.context.window_manager.tl_stuff
+    with timed("fingerprint check"):
+        images = scope_images(s.scope, node_tree)
+        fingerprint = scan_fingerprint(s.scope, node_tree, images)
+    if fingerprint != _watch["fingerprint"]:
+        if not restore_scan(s, fingerprint, images):
+            scan_tree(s, node_tree, images)
+        area.tag_redraw()
+    return None
 
-    items.clear()
+######################################################################
+# ask for the fingerprint to be checked soon
 
-    index = 0
-    for p in sorted_paths:
 
-        # find most recent parent folder (or -1 if it's a root path)
-        parent = -1
-        for i in range(index - 1, -1, -1):
-            if items[i].is_folder and bpy.path.is_subdir(p, items[i].path):
-                parent = i
-                break
+def request_check():
+    _watch["dirty"] = True
+    if not bpy.app.timers.is_registered(check_for_changes):
+        bpy.app.timers.register(check_for_changes,
+                                first_interval=CHECK_INTERVAL)
 
-        # add folder to the list
-        x = items.add()
-        x.is_folder = True
-        x.path = p
-        x.index = index
-        x.parent = parent
-        x.expanded = True
-
-        # was this one (or a child of this one) selected before?
-        if p == old_path or p == old_parent:
-            old_parent = ""
-            new_index = index
-
-        parent = index
-        index += 1
-
-        # add the files in that folder to the list
-        for t in paths[p]:
-            y = items.add()
-            y.is_folder = False
-            y.path = t["filename"]
-            y.index = index
-            y.parent = parent
-            for i in t['images']:
-                img_ptr = y.images.add()
-                img_ptr.img = i
-
-            # refresh the preview from image 0, should be the same for all
-            # the images in the list
-            t['images'][0].preview.reload()
-
-            # was this the one they had selected before?
-            if new_index == parent and old_path == y.path:
-                new_index = index
-                old_path = ""
-                old_parent = ""
-
-            index += 1
-
-    # selection index hopefully pointing at same old one or none
-    s.list_index = new_index
+######################################################################
+# handlers
+
+
+# node trees which have changed are forgotten (see node_tree_contents),
+# for a material (or world, light etc) that's its node tree
+
+
+@bpy.app.handlers.persistent
+def on_depsgraph_update(scene, depsgraph=None):
+    if depsgraph is None:
+        forget_tree_contents()
+    else:
+        changed = []
+        for update in depsgraph.updates:
+            data = update.id.original
+            if isinstance(data, bpy.types.NodeTree):
+                changed.append(data.as_pointer())
+            else:
+                node_tree = getattr(data, "node_tree", None)
+                if node_tree is not None:
+                    changed.append(node_tree.as_pointer())
+        forget_tree_contents(changed)
+    request_check()
+
+
+# undo/redo makes new copies of everything so the pointers are no good
+@bpy.app.handlers.persistent
+def on_undo_redo(scene=None, dummy=None):
+    forget_tree_contents()
+
+
+# new file so anything which was scanned is gone
+@bpy.app.handlers.persistent
+def on_load_post(dummy=None):
+    cancel_remap_plan()
+    _remap["job"] = None
+    _model["tree"] = TextureTree()
+    _scan_cache.clear()
+    forget_tree_contents()
+    reset_file_watch()
+    if _duplicates["future"] is not None:
+        _duplicates["future"].cancel()
+    _duplicates.update(groups=None, future=None)
+    _first_mtimes.clear()
+    _watch["fingerprint"] = None
+    request_check()
 
 ######################################################################
 
@@ -582,8 +3327,11 @@ class TEXTURE_LOCATOR_OT_Refresh(Operator):
     def poll(cls, context):
         return is_in_shader_node_editor(context)
 
+    @timed_execute("operator: Refresh")
     def execute(self, context):
-        do_scan(context)
+        forget_tree_contents()
+        scan_tree(context.window_manager.tl_stuff,
+                  context.space_data.node_tree)
         return {'FINISHED'}
 
 ######################################################################
@@ -609,20 +3357,15 @@ class TEXTURE_LOCATOR_PT_TextureLocatorPanel(Panel):
 
         s = context.window_manager.tl_stuff
 
-        active = context.active_object
+        # if the node tree being shown has changed (e.g. the active
+        # material changed) get the timer to check it, the scan
+        # happens there rather than in here
 
-        # rescan the tree when active material changes or changes
-        # have been made via the Change File/Folder button
-
-        # would be nice to track node new/delete but msgbus doesn't
-        # seem to want to play ball there so if you add/remove any
-        # nodes you have to manually refresh it
-
-        if (active.active_material.name != s.material_name
-                or s.refresh_required):
-            s.refresh_required = False
-            s.material_name = active.active_material.name
-            do_scan(context)
+        node_tree = context.space_data.node_tree
+        pointer = node_tree.as_pointer() if node_tree else 0
+        if pointer != _watch["tree"]:
+            _watch["tree"] = pointer
+            request_check()
 
         # first the buttons
         items = s.list_items
@@ -645,13 +3388,32 @@ class TEXTURE_LOCATOR_PT_TextureLocatorPanel(Panel):
         else:
             cols[1].operator("texture_locator.change_file")
 
+        row = layout.row()
+        row.prop(s, "scope", text="")
+        row.operator("texture_locator.locate_missing")
+        row.operator("texture_locator.find_duplicates")
+
+        # a pending folder change
+        if _remap["plan"] is not None:
+            draw_remap_plan(layout.box(), _remap["plan"])
+
+        # duplicates which have been found (or are being looked for)
+        if (_duplicates["groups"] is not None
+                or _duplicates["future"] is not None):
+            draw_duplicates(layout.box(), _model["tree"])
+
         # then the UIList (treeview)
         row = layout.row()
-        row.template_list("TEXTURE_LOCATOR_UL_List", "Items",
-                          s, "list_items", s, "list_index")
+        _timing["draw_item"] = 0.0
+        with timed("template_list"):
+            row.template_list("TEXTURE_LOCATOR_UL_List", "Items",
+                              s, "list_items", s, "list_index")
+        if _timing["enabled"]:
+            record_time("draw_item (total)", _timing["draw_item"])
 
         # then details and image preview if selected item is an image
-        if 0 <= index < len(items):
+        tree = _model["tree"]
+        if 0 <= index < len(items) and len(items) == len(tree):
             item = items[index]
             if not item.is_folder:
 
@@ -660,28 +3422,206 @@ class TEXTURE_LOCATOR_PT_TextureLocatorPanel(Panel):
                     row = layout.row()
                     row.prop(img.img, "name", icon="IMAGE_DATA", text="")
 
-                # then image dimensions (will be 0 x 0 for a missing file)
-                image = item.images[0].img
+                # then the file status from the last check
+                path = tree.nodes[index].filepath
+                status = file_status(path)
                 row = layout.row()
-                row.label(text=f"{image.size[0]} x {image.size[1]}")
+                if status is None:
+                    row.label(text="Checking file...")
+                elif status.status == 'MISSING':
+                    row.label(text="File not found", icon="ERROR")
+                else:
+                    modified = ("  (modified)"
+                                if status.status == 'MODIFIED' else "")
+                    row.label(text=format_size(status.size) + modified)
+
+                # then any other files with the same contents
+                node = tree.nodes[index]
+                if node.duplicate:
+                    size, group = tree.duplicate_groups[node.duplicate - 1]
+                    for i in group:
+                        if i != index:
+                            layout.label(text=tree.nodes[i].filepath,
+                                         icon="DUPLICATE")
+
+                # then image dimensions/format from the file header
+                # (read along with the status)
+                if status is not None and status.status != 'MISSING':
+                    info = status.info
+                    row = layout.row()
+                    if info is None:
+                        row.label(text="Can't read image header")
+                    else:
+                        row.label(text=f"{info.width} x {info.height}  "
+                                  f"{info.format} {info.channels} x "
+                                  f"{info.bit_depth} bit  "
+                                  f"({format_size(image_memory(info))} "
+                                  "loaded)")
 
                 # then an image preview
+                preview = get_preview(context, path)
                 row = layout.row()
-                row.template_icon(icon_value=image.preview.icon_id, scale=8)
+                row.template_icon(icon_value=preview.icon_id, scale=8)
+
+######################################################################
+# show the duplicates which were found
+
+
+def draw_duplicates(layout, tree):
+    if _duplicates["future"] is not None:
+        layout.label(text="Looking for duplicates...", icon="TIME")
+        return
+    groups = tree.duplicate_groups
+    if not groups:
+        layout.label(text="No duplicates found", icon="CHECKMARK")
+    else:
+        files = sum(len(group) for size, group in groups)
+        wasted = sum(size * (len(group) - 1) for size, group in groups)
+        layout.label(text=f"{files} files in {len(groups)} groups have "
+                     "the same contents", icon="DUPLICATE")
+        layout.label(text=f"{format_size(wasted)} could be saved")
+    row = layout.row(align=True)
+    row.operator("texture_locator.consolidate")
+    row.operator("texture_locator.clear_duplicates")
+
+######################################################################
+# show what a folder change will do
+
+
+def draw_remap_plan(layout, plan):
+    layout.label(text=plan.old_dir, icon="FILE_FOLDER")
+    layout.label(text=plan.new_dir, icon="FORWARD")
+    total = len(plan.moves)
+    if plan.found is None:
+        layout.label(text=f"Checking {total} files...", icon="TIME")
+    else:
+        missing = len(plan.missing)
+        layout.label(text=f"{total - missing} files found, "
+                     f"{missing} not found",
+                     icon="ERROR" if missing else "CHECKMARK")
+        for newfile in plan.missing[:REMAP_PREVIEW_ROWS]:
+            layout.label(text=newfile)
+        if missing > REMAP_PREVIEW_ROWS:
+            layout.label(text=f"...and {missing - REMAP_PREVIEW_ROWS} more")
+    row = layout.row(align=True)
+    row.operator("texture_locator.apply_remap")
+    row.operator("texture_locator.cancel_remap")
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_ResetTimings(Operator):
+
+    """ Forget the recorded timings """
+
+    bl_idname = "texture_locator.reset_timings"
+    bl_label = "Reset"
+
+    def execute(self, context):
+        _timings.clear()
+        return {'FINISHED'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_OT_SaveTimings(Operator):
+
+    """ Save the recorded timings to a JSON file (for bug reports) """
+
+    bl_idname = "texture_locator.save_timings"
+    bl_label = "Save"
+
+    filepath: StringProperty(subtype='FILE_PATH')
+    filename_ext = ".json"
+
+    def execute(self, context):
+        s = context.window_manager.tl_stuff
+        report = {
+            "version": bl_info["version"],
+            "blender": bpy.app.version_string,
+            "scope": s.scope,
+            "items": len(s.list_items),
+            "stats_ms": timing_stats(),
+            "history_ms": {name: [t * 1000 for t in history]
+                           for name, history in _timings.items()}
+        }
+        try:
+            with open(self.filepath, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            self.report({'ERROR'}, f"Can't save {self.filepath}: {e}")
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.filepath = "texture_locator_timings.json"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+######################################################################
+
+
+class TEXTURE_LOCATOR_PT_Diagnostics(Panel):
+
+    """ Timings for the Texture Locator Panel """
+
+    bl_label = "Diagnostics"
+    bl_parent_id = "TEXTURE_LOCATOR_PT_TextureLocatorPanel"
+    bl_space_type = 'NODE_EDITOR'
+    bl_region_type = 'UI'
+    bl_context = "node"
+    bl_category = "Tool"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+
+        s = context.window_manager.tl_stuff
+        layout = self.layout
+
+        row = layout.row(align=True)
+        row.prop(s, "record_timings")
+        row.operator("texture_locator.reset_timings")
+        row.operator("texture_locator.save_timings")
+
+        stats = timing_stats()
+        if not stats:
+            layout.label(text="No timings recorded")
+            return
+
+        # name then last/mean/max in ms
+        cols = split_layout(layout.box(), [4, 1, 1, 1, 1])
+        for col, heading in zip(cols, ("", "Count", "Last", "Mean", "Max")):
+            col.label(text=heading)
+        for name, stat in stats.items():
+            cols[0].label(text=name)
+            cols[1].label(text=str(stat["count"]))
+            cols[2].label(text=f"{stat['last']:.2f}")
+            cols[3].label(text=f"{stat['mean']:.2f}")
+            cols[4].label(text=f"{stat['max']:.2f}")
 
 ######################################################################
 
 
 classes = [
+    TextureLocatorPreferences,
     ImagePointer,
     ListItem,
     MyStuff,
     TEXTURE_LOCATOR_OT_ChangeFile,
     TEXTURE_LOCATOR_OT_ChangeFolder,
+    TEXTURE_LOCATOR_OT_ApplyRemap,
+    TEXTURE_LOCATOR_OT_CancelRemap,
+    TEXTURE_LOCATOR_OT_LocateMissing,
+    TEXTURE_LOCATOR_OT_FindDuplicates,
+    TEXTURE_LOCATOR_OT_Consolidate,
+    TEXTURE_LOCATOR_OT_ClearDuplicates,
     TEXTURE_LOCATOR_UL_List,
     TEXTURE_LOCATOR_OT_Refresh,
     TEXTURE_LOCATOR_OT_Select,
-    TEXTURE_LOCATOR_PT_TextureLocatorPanel
+    TEXTURE_LOCATOR_PT_TextureLocatorPanel,
+    TEXTURE_LOCATOR_OT_ResetTimings,
+    TEXTURE_LOCATOR_OT_SaveTimings,
+    TEXTURE_LOCATOR_PT_Diagnostics
 ]
 
 ######################################################################
@@ -689,24 +3629,252 @@ classes = [
 
 def register():
 
+    global _previews
+    _previews = bpy.utils.previews.new()
+
     for c in classes:
         bpy.utils.register_class(c)
 
     bpy.types.WindowManager.tl_stuff = bpy.props.PointerProperty(type=MyStuff)
 
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.load_post.append(on_load_post)
+    bpy.app.handlers.undo_post.append(on_undo_redo)
+    bpy.app.handlers.redo_post.append(on_undo_redo)
+
 ######################################################################
 
 
 def unregister():
 
+    bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    bpy.app.handlers.load_post.remove(on_load_post)
+    bpy.app.handlers.undo_post.remove(on_undo_redo)
+    bpy.app.handlers.redo_post.remove(on_undo_redo)
+    if bpy.app.timers.is_registered(check_for_changes):
+        bpy.app.timers.unregister(check_for_changes)
+    _watch["tree"] = 0
+    _watch["fingerprint"] = None
+    _scan_cache.clear()
+    forget_tree_contents()
+    _timing["enabled"] = False
+    _timings.clear()
+
+    cancel_remap_plan()
+
+    global _io_pool
+    if bpy.app.timers.is_registered(apply_status_results):
+        bpy.app.timers.unregister(apply_status_results)
+    if bpy.app.timers.is_registered(poll_file_watch):
+        bpy.app.timers.unregister(poll_file_watch)
+    reset_file_watch()
+    if bpy.app.timers.is_registered(poll_find_duplicates):
+        bpy.app.timers.unregister(poll_find_duplicates)
+    if _duplicates["future"] is not None:
+        _duplicates["future"].cancel()
+    _duplicates.update(groups=None, future=None)
+    _hash_cache.clear()
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False)
+        _io_pool = None
+
     del bpy.types.WindowManager.tl_stuff
 
     for c in classes:
         bpy.utils.unregister_class(c)
 
+    global _previews
+    clear_previews()
+    bpy.utils.previews.remove(_previews)
+    _previews = None
+
+
+######################################################################
+# batch mode - audit/remap lots of .blend files from the command line
+# (see the top of the file), this doesn't need the UI so there's no
+# context.space_data, just the scan and replace_path logic
+
+######################################################################
+# find the new path for a file from a remap table of normalized
+# folder_key(old folder) -> new folder, the deepest matching old folder
+# wins, None if it's not in any of them
+
+
+def remap_path(remap, path):
+    key = folder_key(path)
+    folder = key
+    while True:
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+        new_folder = remap.get(folder)
+        if new_folder is not None:
+            relative = os.path.relpath(os.path.normpath(path), folder)
+            return os.path.join(new_folder, relative)
+
+######################################################################
+# audit (and maybe remap) the images in the currently loaded file
+
+
+def audit_file(scope, remap):
+
+    paths = group_images(scope_images(scope, None))
+    lookup = grouped_lookup(paths)
+    files = [(pointer_images(node.pointers, lookup), node.filepath)
+             for node in TextureTree.from_paths(paths).files()]
+
+    # work out new paths and check everything exists, each folder only
+    # gets listed once
+    new_paths = [remap_path(remap, path) for images, path in files]
+    listings = list_folders(os.path.dirname(p)
+                            for p in ([f for r, f in files]
+                                      + [p for p in new_paths if p]))
+
+    def exists(path):
+        folder, name = os.path.split(path)
+        return os.path.normcase(name) in listings[folder]
+
+    report = []
+    remapped = 0
+    for (images, path), new_path in zip(files, new_paths):
+        entry = {
+            "path": path,
+            "exists": exists(path),
+            "images": [img.name for img in images]
+        }
+        if new_path is not None:
+            entry["new_path"] = new_path
+            entry["remapped"] = exists(new_path)
+            if entry["remapped"]:
+                for img in images:
+                    replace_path(img, new_path)
+                remapped += 1
+        report.append(entry)
+
+    # missing is what's still missing after the remap
+    return {
+        "file": bpy.data.filepath,
+        "files": report,
+        "missing_before": sum(1 for entry in report if not entry["exists"]),
+        "missing": sum(1 for entry in report
+                       if not entry["exists"]
+                       and not entry.get("remapped", False)),
+        "remapped": remapped
+    }
+
+######################################################################
+# load a remap table and normalize the old folders
+
+
+def load_remap(path):
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    return {folder_key(old): new for old, new in table.items()}
+
+######################################################################
+# run in a Blender process which has one .blend file loaded
+
+
+def batch_worker(args):
+    report = audit_file(args.scope, load_remap(args.remap))
+    if args.save and report["remapped"]:
+        bpy.ops.wm.save_mainfile()
+        report["saved"] = True
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return 0
+
+######################################################################
+# run a worker Blender process for one .blend file and get its report
+
+
+def run_batch_worker(args, blend_file, report_path):
+    command = [bpy.app.binary_path, "-b", "--factory-startup", blend_file,
+               "--python-exit-code", "1",
+               "--python", os.path.abspath(__file__), "--",
+               "--worker", "--report", report_path, "--scope", args.scope]
+    if args.remap:
+        command += ["--remap", os.path.abspath(args.remap)]
+    if args.save:
+        command.append("--save")
+
+    result = subprocess.run(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {
+            "file": blend_file,
+            "error": f"exit code {result.returncode}",
+            "output": result.stdout[-4000:]
+        }
+
+######################################################################
+# fan the .blend files out to worker processes and combine the reports
+
+
+def batch_driver(args):
+    with tempfile.TemporaryDirectory() as temp:
+        reports = [os.path.join(temp, f"{n}.json")
+                   for n in range(len(args.files))]
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            results = list(pool.map(
+                lambda job: run_batch_worker(args, *job),
+                zip(args.files, reports)))
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump({"files": results}, f, indent=2)
+
+    failed = sum(1 for r in results if "error" in r)
+    for r in results:
+        if "error" in r:
+            print(f"Error: {r['file']}: {r['error']}")
+        else:
+            print(f"{r['file']}: {len(r['files'])} files, "
+                  f"{r['missing']} missing, {r['remapped']} remapped")
+    return 1 if failed else 0
+
+######################################################################
+# command line entry point, argv is everything after '--'
+
+
+def batch_main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python texture_locator.py --",
+        description="Report on (and optionally remap) the image files "
+                    "used by .blend files")
+    parser.add_argument("--report",
+                        help="JSON report to write")
+    parser.add_argument("--remap",
+                        help="JSON object of old folder -> new folder")
+    parser.add_argument("--save", action="store_true",
+                        help="save .blend files which were remapped")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of Blender processes to run at once")
+    parser.add_argument("--scope", choices=["MATERIALS", "IMAGES"],
+                        default="MATERIALS",
+                        help="images used by materials or all images")
+    parser.add_argument("--worker", action="store_true",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("files", nargs="*", help=".blend files")
+    args = parser.parse_args(argv)
+
+    if not args.report:
+        parser.error("--report is required")
+    if args.worker:
+        return batch_worker(args)
+    return batch_driver(args)
 
 ######################################################################
 
 
 if __name__ == "__main__":
+    if bpy.app.background and "--" in sys.argv:
+        sys.exit(batch_main(sys.argv[sys.argv.index("--") + 1:]))
     register()